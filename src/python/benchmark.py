@@ -0,0 +1,267 @@
+'''Measures the wall time and the peak memory of every stage of the pipeline
+for every image in a directory, and compares the results of two runs.
+
+Usage:
+
+    python3 src/python/benchmark.py run [image_directory] [--resolutions N ...] [--repeat R] [--pure-python] [--output results.json]
+    python3 src/python/benchmark.py compare baseline.json results.json [--threshold T]
+
+The stages are:
+
+    threshold             Converting the image to black and white.
+    denoise_image         Denoising the black and white image.
+    trace                 Tracing the denoised image into an SVG path.
+    svg_path_to_polygon   Sampling the SVG path into a polygon.
+    get_polygon_from_svg  Reading the polygon into a Shapely shape.
+    get_blocks            Computing the occupancy grid ("Structure.get_blocks").
+    platforms_and_pigs    Placing the platforms and the pigs.
+    write_level           Writing the level XML.
+
+The last three stages are run for every number of primary blocks on X axis given
+by "--resolutions", and the numbers of primary blocks, platform blocks and pigs
+of the levels are recorded along with them.
+
+The threshold and the trace stages use ImageMagick and Potrace. If
+"--pure-python" is given, or if they are not installed, they are done in Python
+using "src/python/raster_to_vector.py" instead, and the traced outline is
+written as an SVG path so that the rest of the stages are the same. The memory
+used by ImageMagick and Potrace is not included in the peak memory, which is
+measured using "tracemalloc".
+
+The time of a stage is the minimum of "--repeat" runs. "compare" prints the
+ratio of the total time of every stage between two runs and exits with 1 if any
+stage got slower by more than the threshold (for example, 0.1 for 10%) or if the
+levels have different numbers of blocks.
+'''
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from json import dump, load
+from os import symlink
+from os.path import abspath, basename, join
+from platform import python_version
+from shutil import which
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import tracemalloc
+
+from imageio import imread
+
+from denoise_image import denoise_image
+from generate_level import (get_black_and_white_image_using_imagemagick,
+                            get_intermediate_base_names,
+                            trace_image_using_potrace)
+from generate_levels_for_images import IMAGE_DIRECTORY, get_image_file_names
+from grid import Grid
+from raster_to_vector import threshold_image, trace_image, write_path_svg
+from structure import create_structure, get_level_name, get_polygon_from_svg
+from svg_path_to_polygon import convert_svg_path_to_polygon
+
+CONFIG_FILE_NAME = 'config.ini'
+EXTERNAL_TOOLS = ('convert', 'mogrify', 'potrace')
+DEFAULT_THRESHOLD = .1
+IMAGE_STAGES = ('threshold', 'denoise_image', 'trace', 'svg_path_to_polygon', 'get_polygon_from_svg')
+STRUCTURE_STAGES = ('get_blocks', 'platforms_and_pigs', 'write_level')
+BLOCK_COUNT_DEFAULTS = {'merged_blocks': 0}
+'''The block counts that were added after some of the benchmarks were recorded,
+and their values in those benchmarks.'''
+
+
+def measure(function, repeat=1):
+    '''Returns the result of the function and the measurements. The function
+    is called "repeat" times for the wall time and once more for the peak
+    memory, since tracemalloc slows the function down.'''
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        result = function()
+        times.append(perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'time': min(times), 'peak_memory': peak_memory}
+
+
+def get_threshold_function(image_file_name, pure_python):
+    if pure_python:
+        image = imread(image_file_name)
+        return lambda: threshold_image(image)
+    return lambda: get_black_and_white_image_using_imagemagick(image_file_name)
+
+
+def get_trace_function(image_file_name, denoised_image, pure_python):
+    '''The returned function returns the name of the SVG that has the traced
+    path.'''
+    if not pure_python:
+        return lambda: trace_image_using_potrace(image_file_name, denoised_image)
+    _, denoised_base_name, _ = get_intermediate_base_names(image_file_name)
+    def trace():
+        write_path_svg(f'{denoised_base_name}.svg', trace_image(denoised_image), *denoised_image.shape[::-1])
+        return f'{denoised_base_name}.svg'
+    return trace
+
+
+def benchmark_structure(level_path, shape, config, resolution, repeat):
+    measurements = {}
+    structure = create_structure(level_path, shape, config, num_primary_blocks_on_x_axis=resolution)
+    _, measurements['get_blocks'] = measure(structure.compute_blocks, repeat)
+    structure.place_primary_blocks()
+    primary_blocks = structure.grid
+    def place_platforms_and_pigs():
+        structure.grid = Grid(primary_blocks.cells)
+        structure.place_platforms()
+        structure.place_pigs()
+    _, measurements['platforms_and_pigs'] = measure(place_platforms_and_pigs, repeat)
+    _, measurements['write_level'] = measure(lambda: structure.write_level_to_file(level_path + '.xml'), repeat)
+    return {'stages': measurements, 'block_counts': structure.get_block_counts()}
+
+
+def benchmark_image(image_file_name, config, resolutions, repeat, pure_python, directory):
+    '''The intermediate files are written to the given directory.'''
+    linked_image_file_name = join(directory, basename(image_file_name))
+    symlink(abspath(image_file_name), linked_image_file_name)
+    denoise_mode = config.get('DEFAULT', 'DenoiseMode', fallback='exact')
+    measurements = {}
+    black_and_white_image, measurements['threshold'] = measure(get_threshold_function(linked_image_file_name, pure_python), repeat)
+    denoised_image, measurements['denoise_image'] = measure(lambda: denoise_image(black_and_white_image, denoise_mode), repeat)
+    svg_file_name, measurements['trace'] = measure(get_trace_function(linked_image_file_name, denoised_image, pure_python), repeat)
+    (polygon_svg_file_name, rings), measurements['svg_path_to_polygon'] = measure(lambda: convert_svg_path_to_polygon(svg_file_name), repeat)
+    shape, measurements['get_polygon_from_svg'] = measure(lambda: get_polygon_from_svg(polygon_svg_file_name), repeat)
+    level_path = join(directory, get_level_name(image_file_name))
+    return {'stages': measurements,
+            'number_of_vertices': sum(len(ring) for ring in rings),
+            'resolutions': {str(resolution): benchmark_structure(f'{level_path}-{resolution}', shape, config, resolution, repeat)
+                            for resolution in resolutions}}
+
+
+def get_stage_totals(results):
+    '''Returns the total time and the maximum peak memory of every stage over
+    all of the images and the resolutions.'''
+    totals = {stage: {'time': 0, 'peak_memory': 0} for stage in IMAGE_STAGES + STRUCTURE_STAGES}
+    for image_results in results['images'].values():
+        stage_measurements = [image_results['stages']]
+        stage_measurements.extend(resolution_results['stages'] for resolution_results in image_results['resolutions'].values())
+        for measurements in stage_measurements:
+            for stage, measurement in measurements.items():
+                totals[stage]['time'] += measurement['time']
+                totals[stage]['peak_memory'] = max(totals[stage]['peak_memory'], measurement['peak_memory'])
+    return totals
+
+
+def run_benchmark(image_directory, config, resolutions, repeat=1, pure_python=False):
+    if not pure_python and not all(which(tool) for tool in EXTERNAL_TOOLS):
+        print('ImageMagick or Potrace is not installed. Running the pure Python stages instead.')
+        pure_python = True
+    results = {'pure_python': pure_python,
+               'python_version': python_version(),
+               'resolutions': resolutions,
+               'repeat': repeat,
+               'images': {},
+               'failures': {}}
+    for image_file_name in get_image_file_names(image_directory):
+        with TemporaryDirectory() as directory:
+            try:
+                results['images'][image_file_name] = benchmark_image(image_file_name, config, resolutions, repeat, pure_python, directory)
+            except Exception as exception:
+                results['failures'][image_file_name] = f'{type(exception).__name__}: {exception}'
+                print(f'{image_file_name} FAILED {results["failures"][image_file_name]}')
+                continue
+        stage_times = ' '.join(f'{stage}={measurement["time"]:.3f}s'
+                               for stage, measurement in results['images'][image_file_name]['stages'].items())
+        print(f'{image_file_name} {stage_times}')
+    results['totals'] = get_stage_totals(results)
+    return results
+
+
+def print_totals(totals):
+    for stage, total in totals.items():
+        print(f'{stage:22} {total["time"]:10.3f}s {total["peak_memory"] / 2 ** 20:10.1f} MiB')
+
+
+def are_block_counts_different(baseline_block_counts, block_counts):
+    '''Compares only the counts that both runs have. The counts in
+    "BLOCK_COUNT_DEFAULTS" are added to the runs that do not have them.'''
+    baseline_block_counts = {**BLOCK_COUNT_DEFAULTS, **baseline_block_counts}
+    block_counts = {**BLOCK_COUNT_DEFAULTS, **block_counts}
+    return any(baseline_block_counts[key] != block_counts[key]
+               for key in baseline_block_counts.keys() & block_counts.keys())
+
+
+def get_block_count_differences(baseline, results):
+    differences = []
+    for image_file_name, image_results in results['images'].items():
+        baseline_image_results = baseline['images'].get(image_file_name)
+        if baseline_image_results is None:
+            continue
+        for resolution, resolution_results in image_results['resolutions'].items():
+            baseline_resolution_results = baseline_image_results['resolutions'].get(resolution)
+            if (baseline_resolution_results is not None
+                and are_block_counts_different(baseline_resolution_results['block_counts'], resolution_results['block_counts'])):
+                differences.append(f'{image_file_name} {resolution}: '
+                                   f'{baseline_resolution_results["block_counts"]} -> {resolution_results["block_counts"]}')
+    return differences
+
+
+def compare_results(baseline, results, threshold=DEFAULT_THRESHOLD):
+    '''Returns the stages that got slower by more than the threshold and the
+    levels whose block counts differ. The stages that are not in both runs are
+    skipped.'''
+    if baseline['pure_python'] != results['pure_python']:
+        print('Warning: only one of the runs is a pure Python run.')
+    regressions = []
+    for stage, total in results['totals'].items():
+        if stage not in baseline['totals']:
+            print(f'{stage:22} skipped, since it is not in the baseline')
+            continue
+        baseline_time = baseline['totals'][stage]['time']
+        ratio = total['time'] / baseline_time if baseline_time else 1
+        is_regression = ratio > 1 + threshold
+        if is_regression:
+            regressions.append(stage)
+        print(f'{stage:22} {baseline_time:10.3f}s {total["time"]:10.3f}s {ratio:6.2f}x'
+              + (' REGRESSION' if is_regression else ''))
+    differences = get_block_count_differences(baseline, results)
+    for difference in differences:
+        print(f'Different block counts: {difference}')
+    return regressions, differences
+
+
+if __name__ == '__main__':
+    config = ConfigParser()
+    config.read(CONFIG_FILE_NAME)
+    argument_parser = ArgumentParser()
+    subparsers = argument_parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('image_directory', nargs='?', default=IMAGE_DIRECTORY)
+    run_parser.add_argument('--resolutions',
+                            type=int,
+                            nargs='+',
+                            default=[int(config.get('DEFAULT', 'NumberOfPrimaryBlocksOnXAxis'))])
+    run_parser.add_argument('--repeat', type=int, default=1)
+    run_parser.add_argument('--pure-python', action='store_true')
+    run_parser.add_argument('--output', default='benchmark.json')
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline_file_name')
+    compare_parser.add_argument('results_file_name')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    arguments = argument_parser.parse_args()
+
+    if arguments.command == 'run':
+        results = run_benchmark(arguments.image_directory,
+                                config,
+                                arguments.resolutions,
+                                arguments.repeat,
+                                arguments.pure_python)
+        print_totals(results['totals'])
+        with open(arguments.output, 'w') as results_file:
+            dump(results, results_file, indent=2)
+    else:
+        with open(arguments.baseline_file_name) as baseline_file:
+            baseline = load(baseline_file)
+        with open(arguments.results_file_name) as results_file:
+            results = load(results_file)
+        regressions, differences = compare_results(baseline, results, arguments.threshold)
+        if regressions or differences:
+            exit(1)
@@ -0,0 +1,84 @@
+'''The shape of a structure as a bitmap, which is used in place of the Shapely
+polygon when the vectorization is skipped. That is, the occupancy grid is
+computed directly from the denoised image, using the area of the foreground
+pixels in every tile, instead of tracing the image and intersecting every tile
+with the polygon.
+
+The foreground pixels are the ones that are in the shape according to the
+tracer (that is, the ones that are darker than "TRACING_LEVEL"), and every pixel
+is treated as a unit square. The coordinates are in pixels.
+
+"get_polygon_from_svg" rotates the polygon by 180 degrees, which flips the image
+back upside down but also mirrors it horizontally. The same is done here, so
+that the columns of the grid start from the right of the image, just like they
+do for the polygon.
+'''
+from hashlib import sha256
+
+import numpy
+
+from raster_to_vector import TRACING_LEVEL
+
+
+class BitmapShape:
+    def __init__(self, denoised_image):
+        is_in_shape = numpy.asarray(denoised_image) < TRACING_LEVEL
+        rows = numpy.flatnonzero(is_in_shape.any(axis=1))
+        columns = numpy.flatnonzero(is_in_shape.any(axis=0))
+        if not len(rows):
+            raise ValueError('There is nothing in the image.')
+        self.is_in_shape = is_in_shape[rows[0]:rows[-1] + 1, columns[0]:columns[-1] + 1]
+        # The integral image, where "integral_image[i, j]" is the number of the
+        # foreground pixels above row "i" and left of column "j".
+        self.integral_image = numpy.zeros((self.is_in_shape.shape[0] + 1, self.is_in_shape.shape[1] + 1),
+                                          dtype=numpy.int64)
+        numpy.cumsum(numpy.cumsum(self.is_in_shape, axis=0), axis=1, out=self.integral_image[1:, 1:])
+
+
+    @property
+    def bounds(self):
+        '''Same as the "bounds" of a Shapely geometry.'''
+        height, width = self.is_in_shape.shape
+        return (0., 0., float(width), float(height))
+
+
+    @property
+    def area(self):
+        '''Same as the "area" of a Shapely geometry.'''
+        return float(self.integral_image[-1, -1])
+
+
+    @property
+    def wkb(self):
+        '''Stands in for the WKB of a Shapely geometry in the keys of the
+        cache.'''
+        return sha256(numpy.packbits(self.is_in_shape).tobytes() + repr(self.is_in_shape.shape).encode()).digest()
+
+
+    @staticmethod
+    def interpolate(values, positions, axis):
+        '''Linear interpolation of "values" along the axis at the positions.
+        The positions are clipped to the range of the values.'''
+        positions = numpy.clip(positions, 0, values.shape[axis] - 1)
+        starts = numpy.minimum(positions.astype(int), values.shape[axis] - 2)
+        fractions = positions - starts
+        start_values = numpy.take(values, starts, axis=axis)
+        end_values = numpy.take(values, starts + 1, axis=axis)
+        shape = [1, 1]
+        shape[axis] = -1
+        fractions = fractions.reshape(shape)
+        return start_values * (1 - fractions) + end_values * fractions
+
+
+    def get_area_fractions(self, tile_width, tile_height, num_rows, num_columns, first_row=0):
+        '''Returns the fraction of the area of every tile that is covered by the
+        foreground pixels. The integral image of the pixels is bilinear between
+        the pixel corners, hence interpolating it gives the exact area.'''
+        height, width = self.is_in_shape.shape
+        row_edges = numpy.arange(first_row, first_row + num_rows + 1) * tile_height
+        # The columns start from the right of the image.
+        column_edges = width - numpy.arange(num_columns + 1) * tile_width
+        integral_image = self.interpolate(self.interpolate(self.integral_image, row_edges, 0), column_edges, 1)
+        areas = (integral_image[1:, :-1] - integral_image[:-1, :-1]
+               - integral_image[1:, 1:] + integral_image[:-1, 1:])
+        return areas / (tile_width * tile_height)
@@ -0,0 +1,118 @@
+'''Replaces the primary blocks of a structure with larger blocks, so that the
+level has fewer objects. Every occupied cell of the grid is a primary block.
+When "MergeBlocks" is enabled in "config.ini", the occupied cells are covered
+with the larger blocks in "BLOCK_REGISTRY" first and only the cells that are
+left are primary blocks.
+
+A block covers a rectangle of cells. It is never larger than the rectangle, so
+that the silhouette and the pig cavities are kept, and it is smaller than the
+rectangle by at most "MergeTolerance" on each axis. The blocks can be rotated by
+90 degrees. A block is never placed across a platform, since the platform blocks
+are between the rows of the primary blocks.
+
+The cover is greedy: the candidates are tried from the one that covers the most
+cells to the one that covers the least, and every candidate is placed at every
+free place that it fits in, from the bottom row to the top and from the left to
+the right.
+
+Usage:
+
+    python3 src/python/block_merging.py polygon_svg_file ... [--merge-tolerance T ...]
+
+prints the number of objects of every level without merging and with merging
+for every tolerance, without writing any levels.
+'''
+import numpy
+
+MERGEABLE_BLOCK_NAMES = ('long_rectangle',
+                         'medium_rectangle',
+                         'small_rectangle',
+                         'tiny_rectangle',
+                         'fat_rectangle',
+                         'small_square')
+'''"square_with_hole" is not used, since its hole would show through the
+silhouette.'''
+
+
+class MergeCandidate:
+    def __init__(self, block, rotation, num_columns, num_rows, shortfall):
+        self.block = block
+        self.rotation = rotation
+        self.num_columns = num_columns
+        self.num_rows = num_rows
+        self.shortfall = shortfall
+        '''The larger of the differences between the size of the covered
+        rectangle and the size of the block on the two axes.'''
+
+
+    @property
+    def num_cells(self):
+        return self.num_columns * self.num_rows
+
+
+    @property
+    def height(self):
+        '''The height of the block as it is placed.'''
+        return self.block.width if self.rotation else self.block.height
+
+
+def get_sorted_candidates(candidates):
+    return sorted(candidates, key=lambda candidate: (-candidate.num_cells, candidate.shortfall, candidate.rotation))
+
+
+def get_runs(cells):
+    '''Returns the start and end (exclusive) indices of the runs of True in a
+    one dimensional array.'''
+    changes = numpy.flatnonzero(numpy.diff(numpy.concatenate(([False], cells, [False])).astype(numpy.int8)))
+    return zip(changes[::2].tolist(), changes[1::2].tolist())
+
+
+def merge_cells(cells, platforms, candidates):
+    '''Returns the merged blocks as (candidate, column, row) tuples, where the
+    column and the row are of the bottom left cell, and the mask of the cells
+    that are covered by them. The rows of "cells" start from the bottom.'''
+    num_rows, num_columns = cells.shape
+    available_cells = numpy.array(cells, dtype=bool)
+    is_platform = numpy.zeros(num_rows + 1, dtype=bool)
+    is_platform[[platform for platform in platforms if 0 <= platform <= num_rows]] = True
+    merged_blocks = []
+    for candidate in get_sorted_candidates(candidates):
+        for row in range(num_rows - candidate.num_rows + 1):
+            rows = slice(row, row + candidate.num_rows)
+            if is_platform[row + 1:row + candidate.num_rows].any():
+                continue
+            for start, end in get_runs(available_cells[rows].all(axis=0)):
+                for column in range(start, end - candidate.num_columns + 1, candidate.num_columns):
+                    merged_blocks.append((candidate, column, row))
+                available_cells[rows, start:start + (end - start) // candidate.num_columns * candidate.num_columns] = False
+    return merged_blocks, numpy.asarray(cells, dtype=bool) & ~available_cells
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from configparser import ConfigParser
+
+    from structure import create_structure, get_polygon_from_svg
+
+    config = ConfigParser()
+    config.read('config.ini')
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('svg_file_names', nargs='+')
+    argument_parser.add_argument('--merge-tolerance',
+                                 type=float,
+                                 nargs='+',
+                                 default=[config.getfloat('DEFAULT', 'MergeTolerance', fallback=.05)])
+    arguments = argument_parser.parse_args()
+    config.set('DEFAULT', 'WriteIntermediateLevels', 'no')
+    for svg_file_name in arguments.svg_file_names:
+        shape = get_polygon_from_svg(svg_file_name)
+        config.set('DEFAULT', 'MergeBlocks', 'no')
+        number_of_objects = create_structure('', shape, config).get_number_of_objects()
+        print(f'{svg_file_name} {number_of_objects} objects without merging')
+        config.set('DEFAULT', 'MergeBlocks', 'yes')
+        for merge_tolerance in arguments.merge_tolerance:
+            config.set('DEFAULT', 'MergeTolerance', str(merge_tolerance))
+            structure = create_structure('', shape, config)
+            print(f'{svg_file_name} {structure.get_number_of_objects()} objects '
+                  f'with merging at tolerance {merge_tolerance} '
+                  f'({len(structure.merged_blocks)} merged blocks)')
@@ -0,0 +1,196 @@
+'''Generates the level of an image or a polygon SVG at the largest resolution
+(that is, number of primary blocks on X axis) whose level has at most a given
+number of objects (blocks and pigs), instead of at "NumberOfPrimaryBlocksOnXAxis".
+
+Usage:
+
+    python3 src/python/budget.py image_or_polygon_svg_file max_objects [--min-pigs P]
+
+The files that end with ".svg" are read as polygon SVGs and the other files are
+read as images, just like "src/python/client.py" does. The level is written to
+"LevelPath/<level name>.xml" and the chosen resolution, the number of objects
+and pigs of its level and the number of resolutions that were tried (the
+probes) are printed.
+
+The search starts from an estimate: the number of primary blocks is about the
+area of the shape divided by the area of a tile, which gives the resolution
+whose primary blocks alone fill the budget. Then, the resolution is doubled or
+halved until the budget is bracketed and the bracket is halved until it is a
+single resolution. All of the probes use the same ProgressiveCoverageEngine,
+hence the shape is prepared once and the tiles that a probe proved to be in or
+out of the shape are not tested again by the later probes.
+
+The number of objects does not always grow with the resolution, hence the
+result is the largest resolution that the binary search finds, which is not
+necessarily the largest one that fits. If "--min-pigs" is given and the level
+has fewer pigs, up to "PIG_SEARCH_WINDOW" lower resolutions are tried as well.
+'''
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from math import sqrt
+
+from cache import get_cache
+from constants import BLOCK_REGISTRY
+from coverage import ProgressiveCoverageEngine
+from generate_level import get_shape
+from metrics import get_metrics
+from structure import Structure, create_structure, get_level_name, get_polygon_from_svg
+
+PIG_SEARCH_WINDOW = 8
+MAX_RESOLUTION = 100000
+
+
+def estimate_resolution(shape, primary_block, max_objects):
+    '''The width of a tile is "shape_width / resolution" and its height is in
+    the proportion of the primary block, hence the number of tiles in the shape
+    is "area * resolution ** 2 * primary_block.width / (shape_width ** 2 *
+    primary_block.height)". The platforms and the pigs are ignored.'''
+    if shape.area <= 0:
+        return 1
+    return max(1, int(Structure.get_shape_width(shape)
+                      * sqrt(max_objects * primary_block.height / (shape.area * primary_block.width))))
+
+
+class ResolutionSearch:
+    def __init__(self, level_path, shape, config, max_objects, min_pigs=0, cache=None, metrics=None):
+        self.level_path = level_path
+        self.shape = shape
+        self.config = config
+        self.max_objects = max_objects
+        self.min_pigs = min_pigs
+        self.cache = cache
+        self.metrics = metrics
+        self.coverage_engine = ProgressiveCoverageEngine()
+        self.counts = {}
+        '''The number of objects and the number of pigs of the level of every
+        probed resolution. The structures of the probes are not kept, since the
+        probes can go well past the chosen resolution.'''
+        self.best_resolution = None
+        self.best_structure = None
+        '''The largest probed resolution that fits and has enough pigs, and
+        its structure.'''
+
+
+    @property
+    def number_of_probes(self):
+        return len(self.counts)
+
+
+    def create_structure(self, resolution):
+        return create_structure(self.level_path,
+                                self.shape,
+                                self.config,
+                                self.cache,
+                                resolution,
+                                self.coverage_engine,
+                                self.metrics)
+
+
+    def probe(self, resolution):
+        '''Returns the number of objects and the number of pigs of the level of
+        the resolution.'''
+        if resolution not in self.counts:
+            structure = self.create_structure(resolution)
+            number_of_objects, number_of_pigs = structure.get_number_of_objects(), structure.get_block_counts()['pigs']
+            self.counts[resolution] = number_of_objects, number_of_pigs
+            if (number_of_objects <= self.max_objects
+                and number_of_pigs >= self.min_pigs
+                and (self.best_resolution is None or resolution > self.best_resolution)):
+                self.best_resolution, self.best_structure = resolution, structure
+        return self.counts[resolution]
+
+
+    def get_structure(self, resolution):
+        '''Returns the structure of a probed resolution. Only the best one is
+        kept, hence the others are created again.'''
+        if resolution == self.best_resolution:
+            return self.best_structure
+        return self.create_structure(resolution)
+
+
+    def fits(self, resolution):
+        return self.probe(resolution)[0] <= self.max_objects
+
+
+    def has_enough_pigs(self, resolution):
+        return self.probe(resolution)[1] >= self.min_pigs
+
+
+    def get_bracket(self, resolution):
+        '''Returns a resolution that fits and a larger one that does not.'''
+        if self.fits(resolution):
+            low, high = resolution, resolution * 2
+            while high <= MAX_RESOLUTION and self.fits(high):
+                low, high = high, high * 2
+            return low, min(high, MAX_RESOLUTION + 1)
+        low, high = resolution // 2, resolution
+        while low and not self.fits(low):
+            low, high = low // 2, low
+        if not low:
+            raise ValueError(f'Even the level of a single primary block on X axis has more than {self.max_objects} objects.')
+        return low, high
+
+
+    def search(self):
+        '''Returns the structure of the chosen resolution.'''
+        primary_block = BLOCK_REGISTRY[self.config.get('DEFAULT', 'PrimaryBlock')]
+        low, high = self.get_bracket(estimate_resolution(self.shape, primary_block, self.max_objects))
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self.fits(middle):
+                low = middle
+            else:
+                high = middle
+        for resolution in range(low, max(low - PIG_SEARCH_WINDOW, 0), -1):
+            if self.fits(resolution) and self.has_enough_pigs(resolution):
+                return self.get_structure(resolution)
+        raise ValueError(f'None of the resolutions from {max(low - PIG_SEARCH_WINDOW + 1, 1)} to {low} '
+                         f'have at least {self.min_pigs} pigs within {self.max_objects} objects.')
+
+
+def generate_level_within_budget(file_name, config, max_objects, min_pigs=0):
+    '''Returns the name of the level file, the structure of the chosen
+    resolution and the number of probes. The timings in the metrics are the
+    totals of all of the probes.'''
+    cache = get_cache(config)
+    metrics = get_metrics(config)
+    try:
+        with metrics.profile():
+            if file_name.endswith('.svg'):
+                level_name, shape = get_level_name(file_name), get_polygon_from_svg(file_name)
+            else:
+                level_name, shape = get_shape(file_name, config, cache, metrics)
+            search = ResolutionSearch(config.get('DEFAULT', 'LevelPath') + level_name,
+                                      shape,
+                                      config,
+                                      max_objects,
+                                      min_pigs,
+                                      cache,
+                                      metrics)
+            structure = search.search()
+            level_file_name = structure.level_path + '.xml'
+            structure.write_level_to_file(level_file_name)
+        metrics.record(max_objects=max_objects, min_pigs=min_pigs, number_of_probes=search.number_of_probes)
+        if config.getboolean('DEFAULT', 'WriteMetrics', fallback=False):
+            structure.write_metrics_to_file(structure.level_path + '.json')
+    finally:
+        if cache is not None:
+            cache.save_statistics()
+    return level_file_name, structure, search.number_of_probes
+
+
+if __name__ == '__main__':
+    config = ConfigParser()
+    config.read('config.ini')
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('file_name')
+    argument_parser.add_argument('max_objects', type=int)
+    argument_parser.add_argument('--min-pigs', type=int, default=0)
+    arguments = argument_parser.parse_args()
+    level_file_name, structure, number_of_probes = generate_level_within_budget(arguments.file_name,
+                                                                               config,
+                                                                               arguments.max_objects,
+                                                                               arguments.min_pigs)
+    print(f'{level_file_name} {structure.num_primary_blocks_on_x_axis} primary blocks on X axis, '
+          f'{structure.get_number_of_objects()} objects, {structure.get_block_counts()["pigs"]} pigs, '
+          f'{number_of_probes} probes')
@@ -0,0 +1,265 @@
+'''An on-disk cache for the artifacts of the stages of the pipeline. The
+artifacts are addressed by the hash of the input of the stage and of the
+parameters that affect the stage. The input of a stage is usually addressed by
+the key of the previous stage, so that a change in a stage invalidates the
+artifacts of the following stages as well.
+
+The keys include "CACHE_VERSION" and the version of the stage in
+"STAGE_VERSIONS". The version of a stage must be bumped whenever what the stage
+computes changes, so that the artifacts that were computed before the change are
+not used. "CACHE_VERSION" is bumped when the format of the cache itself changes.
+
+The cache is enabled by setting "CachePath" in "config.ini". When the total size
+of the cache exceeds "CacheSize" (in megabytes), the least recently used
+artifacts are evicted. The total size is kept up to date in "SIZE_FILE_NAME" as
+the artifacts are written and removed, hence the artifacts are listed only when
+the total size exceeds the limit, instead of on every write.
+
+Usage:
+
+    python3 src/python/cache.py stats
+    python3 src/python/cache.py clear
+'''
+from collections import Counter
+from configparser import ConfigParser
+from fcntl import LOCK_EX, flock
+from hashlib import sha256
+from json import dump, loads
+from os import makedirs, remove, replace, scandir, utime
+from os.path import exists, getsize, join
+from pickle import HIGHEST_PROTOCOL, UnpicklingError, dump as dump_pickle, load as load_pickle
+from shutil import rmtree
+from sys import argv
+from tempfile import NamedTemporaryFile
+
+STATISTICS_FILE_NAME = 'statistics.json'
+SIZE_FILE_NAME = 'size.json'
+EVICTION_TARGET = .9
+'''The artifacts are evicted until the total size is this fraction of the
+limit, so that the artifacts are not listed again on the next write.'''
+DEFAULT_CACHE_SIZE = 1024
+CACHE_VERSION = 1
+STAGE_VERSIONS = {
+    'denoised_image': 1,
+    'polygon': 1,
+    'blocks': 1,
+}
+
+
+class Cache:
+    def __init__(self, directory, size_limit_in_megabytes=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.size_limit = size_limit_in_megabytes * 1024 * 1024
+        self.hits = Counter()
+        self.misses = Counter()
+        makedirs(self.directory, exist_ok=True)
+
+
+    @staticmethod
+    def get_key(stage, *parts):
+        '''The parts can be bytes or anything with a deterministic "repr".'''
+        key_hash = sha256()
+        for part in (CACHE_VERSION, stage, STAGE_VERSIONS[stage], *parts):
+            key_hash.update(part if isinstance(part, bytes) else repr(part).encode())
+            key_hash.update(b'\0')
+        return key_hash.hexdigest()
+
+
+    def get_artifact_file_name(self, stage, key):
+        return join(self.directory, stage, key + '.pickle')
+
+
+    def get(self, stage, key):
+        '''Returns None if the artifact is not in the cache.'''
+        artifact_file_name = self.get_artifact_file_name(stage, key)
+        try:
+            with open(artifact_file_name, 'rb') as artifact_file:
+                artifact = load_pickle(artifact_file)
+        except OSError:
+            self.misses[stage] += 1
+            return None
+        except (EOFError, UnpicklingError, AttributeError, ImportError, ValueError):
+            # The artifact is corrupt or it cannot be unpickled by this version
+            # of the code, for example since a class was moved or renamed.
+            self.misses[stage] += 1
+            self.remove_artifact(artifact_file_name)
+            return None
+        # The modification time is used as the last access time for LRU
+        # eviction since the access time is not updated on most file systems.
+        utime(artifact_file_name)
+        self.hits[stage] += 1
+        return artifact
+
+
+    def set(self, stage, key, artifact):
+        makedirs(join(self.directory, stage), exist_ok=True)
+        # Write to a temporary file and rename it, so that the other processes
+        # never read a partially written artifact.
+        with NamedTemporaryFile(dir=join(self.directory, stage), delete=False) as temporary_file:
+            dump_pickle(artifact, temporary_file, HIGHEST_PROTOCOL)
+        artifact_file_name = self.get_artifact_file_name(stage, key)
+        size_change = getsize(temporary_file.name) - get_file_size(artifact_file_name)
+        replace(temporary_file.name, artifact_file_name)
+        self.update_total_size(size_change)
+
+
+    def remove_artifact(self, artifact_file_name):
+        size = get_file_size(artifact_file_name)
+        remove_artifact_file(artifact_file_name)
+        self.update_total_size(-size)
+
+
+    def update_total_size(self, size_change):
+        '''Adds the change to the total size of the artifacts and evicts the
+        artifacts if the total size exceeds the limit. The artifacts are listed
+        to find the total size only if the size file is not there (for example,
+        after the cache is cleared) or when they are evicted, which also
+        corrects the total size if the processes raced on the same artifact.'''
+        with open(join(self.directory, SIZE_FILE_NAME), 'a+') as size_file:
+            flock(size_file, LOCK_EX)
+            size_file.seek(0)
+            content = size_file.read()
+            try:
+                total_size = loads(content)['total_size'] + size_change
+            except (ValueError, KeyError, TypeError):
+                total_size = sum(size for _, size, _, _ in self.get_artifacts())
+            if total_size > self.size_limit:
+                total_size = self.evict()
+            size_file.seek(0)
+            size_file.truncate()
+            dump({'total_size': total_size}, size_file)
+
+
+    def get_or_compute(self, stage, key, compute):
+        artifact = self.get(stage, key)
+        if artifact is None:
+            artifact = compute()
+            self.set(stage, key, artifact)
+        return artifact
+
+
+    def get_artifacts(self):
+        '''Returns a list of (modification time, size, stage, file name) of the
+        artifacts in the cache.'''
+        artifacts = []
+        for stage_entry in scandir(self.directory):
+            if not stage_entry.is_dir():
+                continue
+            for entry in scandir(stage_entry.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another process.
+                    continue
+                artifacts.append((stat.st_mtime, stat.st_size, stage_entry.name, entry.path))
+        return artifacts
+
+
+    def evict(self):
+        '''Returns the total size of the artifacts that are left.'''
+        artifacts = self.get_artifacts()
+        total_size = sum(size for _, size, _, _ in artifacts)
+        if total_size <= self.size_limit:
+            return total_size
+        for _, size, _, file_name in sorted(artifacts):
+            if total_size <= self.size_limit * EVICTION_TARGET:
+                break
+            remove_artifact_file(file_name)
+            total_size -= size
+        return total_size
+
+
+    def save_statistics(self):
+        '''Adds the hits and the misses of this process to the statistics file
+        of the cache, which is shared by every process using the cache.'''
+        with open(join(self.directory, STATISTICS_FILE_NAME), 'a+') as statistics_file:
+            flock(statistics_file, LOCK_EX)
+            statistics_file.seek(0)
+            content = statistics_file.read()
+            statistics = load_statistics(content)
+            for stage in self.hits.keys() | self.misses.keys():
+                stage_statistics = statistics.setdefault(stage, {'hits': 0, 'misses': 0})
+                stage_statistics['hits'] += self.hits[stage]
+                stage_statistics['misses'] += self.misses[stage]
+            statistics_file.seek(0)
+            statistics_file.truncate()
+            dump(statistics, statistics_file, indent=2, sort_keys=True)
+        self.hits.clear()
+        self.misses.clear()
+
+
+    def get_statistics(self):
+        statistics_file_name = join(self.directory, STATISTICS_FILE_NAME)
+        if not exists(statistics_file_name):
+            return {}
+        with open(statistics_file_name) as statistics_file:
+            return load_statistics(statistics_file.read())
+
+
+    def clear(self):
+        rmtree(self.directory)
+        makedirs(self.directory)
+
+
+def get_file_size(file_name):
+    '''Returns 0 if the file is not there.'''
+    try:
+        return getsize(file_name)
+    except FileNotFoundError:
+        return 0
+
+
+def remove_artifact_file(file_name):
+    try:
+        remove(file_name)
+    except FileNotFoundError:
+        # Removed by another process.
+        pass
+
+
+def load_statistics(content):
+    return loads(content) if content else {}
+
+
+def get_or_compute(cache, stage, key, compute):
+    '''Same as Cache.get_or_compute, except that the artifact is computed if
+    the cache is None.'''
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(stage, key, compute)
+
+
+def get_cache(config):
+    '''Returns None if the cache is not enabled in the config.'''
+    cache_path = config.get('DEFAULT', 'CachePath', fallback=None)
+    if not cache_path:
+        return None
+    return Cache(cache_path, config.getint('DEFAULT', 'CacheSize', fallback=DEFAULT_CACHE_SIZE))
+
+
+def print_statistics(cache):
+    sizes = Counter()
+    counts = Counter()
+    for _, size, stage, _ in cache.get_artifacts():
+        sizes[stage] += size
+        counts[stage] += 1
+    statistics = cache.get_statistics()
+    print(f'{"stage":20} {"hits":>8} {"misses":>8} {"artifacts":>10} {"size (MB)":>10}')
+    for stage in sorted(statistics.keys() | counts.keys()):
+        stage_statistics = statistics.get(stage, {'hits': 0, 'misses': 0})
+        print(f'{stage:20} {stage_statistics["hits"]:8} {stage_statistics["misses"]:8} '
+              f'{counts[stage]:10} {sizes[stage] / 1024 / 1024:10.2f}')
+
+
+if __name__ == '__main__':
+    config = ConfigParser()
+    config.read('config.ini')
+    cache = get_cache(config)
+    if cache is None:
+        exit('The cache is not enabled. Set "CachePath" in "config.ini" to enable it.')
+    if argv[1] == 'stats':
+        print_statistics(cache)
+    elif argv[1] == 'clear':
+        cache.clear()
+    else:
+        exit(f'Unknown command: {argv[1]}')
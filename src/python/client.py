@@ -0,0 +1,84 @@
+'''Sends jobs to a running "src/python/server.py" and prints the results. This
+only imports the standard library, hence it starts quickly.
+
+Usage:
+
+    python3 src/python/client.py file ... [--socket server.sock] [--config KEY=VALUE] ... [--xml]
+
+The files that end with ".svg" are sent as polygon SVGs and the other files are
+sent as images. The name of the level file of every file is printed, in the
+order of the files. If "--xml" is given, the level XML is printed instead. The
+exit status is 1 if any of the levels could not be generated.
+'''
+from argparse import ArgumentParser
+from json import dumps, loads
+from os.path import abspath
+from socket import AF_UNIX, SHUT_WR, SOCK_STREAM, socket
+from sys import stderr
+from threading import Thread
+
+DEFAULT_SOCKET_PATH = 'server.sock'
+
+
+def get_job(file_name, config_overrides, return_xml, job_id):
+    job = {'id': job_id,
+           'svg' if file_name.endswith('.svg') else 'image': abspath(file_name),
+           'config': config_overrides}
+    if return_xml:
+        job['return_xml'] = True
+    return job
+
+
+def send_jobs(connection, jobs):
+    for job in jobs:
+        connection.sendall((dumps(job) + '\n').encode())
+    connection.shutdown(SHUT_WR)
+
+
+def run_jobs(jobs, socket_path=DEFAULT_SOCKET_PATH):
+    '''Returns the results of the jobs in the order of the jobs. The jobs are
+    sent while the results are being received, so that neither the client nor
+    the server waits for the other one to read.'''
+    with socket(AF_UNIX, SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        sender = Thread(target=send_jobs, args=(connection, jobs))
+        sender.start()
+        results = {}
+        with connection.makefile('r') as results_file:
+            for line in results_file:
+                result = loads(line)
+                results[result['id']] = result
+        sender.join()
+    return [results.get(job['id'], {'id': job['id'], 'error': 'The server did not return a result.'})
+            for job in jobs]
+
+
+def get_config_overrides(assignments):
+    config_overrides = {}
+    for assignment in assignments:
+        key, separator, value = assignment.partition('=')
+        if not separator:
+            raise ValueError(f'The config override "{assignment}" is not in KEY=VALUE form.')
+        config_overrides[key] = value
+    return config_overrides
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('file_names', nargs='+')
+    argument_parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH)
+    argument_parser.add_argument('--config', action='append', default=[])
+    argument_parser.add_argument('--xml', action='store_true')
+    arguments = argument_parser.parse_args()
+    config_overrides = get_config_overrides(arguments.config)
+    jobs = [get_job(file_name, config_overrides, arguments.xml, job_id)
+            for job_id, file_name in enumerate(arguments.file_names)]
+    failed = False
+    for file_name, result in zip(arguments.file_names, run_jobs(jobs, arguments.socket)):
+        if 'error' in result:
+            print(f'{file_name} FAILED {result["error"]}', file=stderr)
+            failed = True
+        else:
+            print(result['xml'] if arguments.xml else result['level'])
+    if failed:
+        exit(1)
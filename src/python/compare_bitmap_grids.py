@@ -0,0 +1,89 @@
+'''Compares the occupancy grids that are computed directly from the denoised
+images ("Vectorizer = bitmap" in "config.ini") with the grids that are computed
+from the vectorized images.
+
+Usage:
+
+    python3 src/python/compare_bitmap_grids.py [image_directory] [--number-of-primary-blocks-on-x-axis N ...] [--vectorizer in_memory|potrace]
+
+The image directory is "Images/Edited" by default. The vector grids are computed
+using the "--vectorizer" ("in_memory" by default) and the coverage engine in
+"config.ini". The grids can have a different number of rows, since the bounds of
+the polygon are not exactly the bounds of the pixels. The occupied cells in the
+rows that are in only one of the grids are counted as different.
+
+The "in_memory" vectorizer traces the largest part of the image only, without
+its holes, whereas the bitmap grids cover all of the foreground pixels. Hence,
+with "in_memory", most of the differences come from the images that have more
+than one part or that have holes.
+'''
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+import numpy
+
+from compare_coverage_engines import get_grid_dimensions
+from constants import BLOCK_REGISTRY
+from coverage import BitmapCoverageEngine, get_coverage_engine
+from generate_level import get_shape
+from generate_levels_for_images import IMAGE_DIRECTORY, get_image_file_names
+
+
+def get_vectorizer_config(config, vectorizer):
+    vectorizer_config = ConfigParser()
+    vectorizer_config.read_dict({'DEFAULT': dict(config['DEFAULT'])})
+    vectorizer_config.set('DEFAULT', 'Vectorizer', vectorizer)
+    return vectorizer_config
+
+
+def get_number_of_different_cells(blocks, reference_blocks):
+    blocks = numpy.array(blocks, dtype=bool, ndmin=2)
+    reference_blocks = numpy.array(reference_blocks, dtype=bool, ndmin=2)
+    num_common_rows = min(len(blocks), len(reference_blocks))
+    return int((blocks[:num_common_rows] != reference_blocks[:num_common_rows]).sum()
+               + blocks[num_common_rows:].sum() + reference_blocks[num_common_rows:].sum())
+
+
+def compare_bitmap_grids(image_file_names, config, resolutions, vectorizer):
+    primary_block = BLOCK_REGISTRY[config.get('DEFAULT', 'PrimaryBlock')]
+    coverage_engine = get_coverage_engine(config.get('DEFAULT', 'CoverageEngine', fallback='exact'))
+    bitmap_coverage_engine = BitmapCoverageEngine()
+    vector_config = get_vectorizer_config(config, vectorizer)
+    bitmap_config = get_vectorizer_config(config, 'bitmap')
+    total_different_cells = 0
+    total_cells = 0
+    for image_file_name in image_file_names:
+        _, polygon = get_shape(image_file_name, vector_config)
+        _, bitmap_shape = get_shape(image_file_name, bitmap_config)
+        for num_primary_blocks_on_x_axis in resolutions:
+            grid_dimensions = get_grid_dimensions(polygon, primary_block, num_primary_blocks_on_x_axis)
+            bitmap_grid_dimensions = get_grid_dimensions(bitmap_shape, primary_block, num_primary_blocks_on_x_axis)
+            blocks = coverage_engine.get_blocks(polygon, *grid_dimensions)
+            bitmap_blocks = bitmap_coverage_engine.get_blocks(bitmap_shape, *bitmap_grid_dimensions)
+            different_cells = get_number_of_different_cells(bitmap_blocks, blocks)
+            num_cells = grid_dimensions[2] * grid_dimensions[3]
+            total_different_cells += different_cells
+            total_cells += num_cells
+            print(f'{image_file_name} {num_primary_blocks_on_x_axis:5} '
+                  f'{grid_dimensions[2]:4}x{grid_dimensions[3]:<4} {bitmap_grid_dimensions[2]:4}x{bitmap_grid_dimensions[3]:<4} '
+                  f'{different_cells} different cells')
+    if total_cells:
+        print(f'{total_different_cells} of {total_cells} cells '
+              f'({total_different_cells / total_cells:.2%}) are different')
+
+
+if __name__ == '__main__':
+    config = ConfigParser()
+    config.read('config.ini')
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('image_directory', nargs='?', default=IMAGE_DIRECTORY)
+    argument_parser.add_argument('--number-of-primary-blocks-on-x-axis',
+                                 type=int,
+                                 nargs='+',
+                                 default=[int(config.get('DEFAULT', 'NumberOfPrimaryBlocksOnXAxis'))])
+    argument_parser.add_argument('--vectorizer', choices=['in_memory', 'potrace'], default='in_memory')
+    arguments = argument_parser.parse_args()
+    compare_bitmap_grids(get_image_file_names(arguments.image_directory),
+                         config,
+                         arguments.number_of_primary_blocks_on_x_axis,
+                         arguments.vectorizer)
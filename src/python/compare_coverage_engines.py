@@ -0,0 +1,81 @@
+'''Compares the occupancy grids produced by the coverage engines with the grid
+produced by the exact (reference) engine.
+
+Usage:
+
+    python3 src/python/compare_coverage_engines.py [polygon_svg_file ...] [--number-of-primary-blocks-on-x-axis N ...]
+
+If no number of primary blocks on X axis is given, the one in "config.ini" is
+used. The shapes in "BUILT_IN_SHAPES" are compared as well, before the SVGs.
+'''
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from time import perf_counter
+
+from constants import BLOCK_REGISTRY
+from coverage import COVERAGE_ENGINE_REGISTRY, get_coverage_engine
+from structure import Structure, get_polygon_from_svg
+from svg_path_to_polygon import get_multipolygon_from_rings
+
+BUILT_IN_SHAPES = {
+    # Two <polygon> elements that overlap, whose overlap is a hole according
+    # to the even-odd rule.
+    'overlapping_parts': [[(0, 0), (60, 0), (60, 60), (0, 60)],
+                          [(30, 30), (90, 30), (90, 90), (30, 90)]],
+}
+
+
+def get_grid_dimensions(shape, primary_block, num_primary_blocks_on_x_axis):
+    '''Same calculations as the ones that are done in Structure.__init__'''
+    primary_block_factor = Structure.get_shape_width(shape) / num_primary_blocks_on_x_axis / primary_block.width
+    tile_width = primary_block.width * primary_block_factor
+    tile_height = primary_block.height * primary_block_factor
+    num_rows = Structure.get_number_of_instances_required_to_cover_distance(Structure.get_shape_height(shape),
+                                                                             tile_height)
+    return tile_width, tile_height, num_rows, num_primary_blocks_on_x_axis
+
+
+def get_number_of_different_cells(blocks, reference_blocks):
+    return sum(block != reference_block
+               for row, reference_row in zip(blocks, reference_blocks)
+               for block, reference_block in zip(row, reference_row))
+
+
+def get_shapes(svg_file_names):
+    '''Returns (name, shape) of the built-in shapes and of the SVGs.'''
+    shapes = [(name, get_multipolygon_from_rings(rings)) for name, rings in BUILT_IN_SHAPES.items()]
+    return shapes + [(svg_file_name, get_polygon_from_svg(svg_file_name)) for svg_file_name in svg_file_names]
+
+
+def compare_coverage_engines(svg_file_names, primary_block, resolutions):
+    for svg_file_name, shape in get_shapes(svg_file_names):
+        # The engines are kept for all of the resolutions of a shape, just like
+        # "src/python/sweep.py" keeps the progressive engine.
+        engines = {engine_name: get_coverage_engine(engine_name) for engine_name in COVERAGE_ENGINE_REGISTRY}
+        for num_primary_blocks_on_x_axis in resolutions:
+            grid_dimensions = get_grid_dimensions(shape, primary_block, num_primary_blocks_on_x_axis)
+            reference_blocks = None
+            for engine_name, engine in engines.items():
+                start = perf_counter()
+                blocks = engine.get_blocks(shape, *grid_dimensions)
+                elapsed = perf_counter() - start
+                if reference_blocks is None:
+                    reference_blocks = blocks
+                print(f'{svg_file_name} {num_primary_blocks_on_x_axis:5} {engine_name:11} '
+                      f'{elapsed:8.3f}s '
+                      f'{get_number_of_different_cells(blocks, reference_blocks)} different cells')
+
+
+if __name__ == '__main__':
+    config = ConfigParser()
+    config.read('config.ini')
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('svg_file_names', nargs='*')
+    argument_parser.add_argument('--number-of-primary-blocks-on-x-axis',
+                                 type=int,
+                                 nargs='+',
+                                 default=[int(config.get('DEFAULT', 'NumberOfPrimaryBlocksOnXAxis'))])
+    arguments = argument_parser.parse_args()
+    compare_coverage_engines(arguments.svg_file_names,
+                             BLOCK_REGISTRY[config.get('DEFAULT', 'PrimaryBlock')],
+                             arguments.number_of_primary_blocks_on_x_axis)
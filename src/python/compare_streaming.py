@@ -0,0 +1,95 @@
+'''Checks that the streaming mode ("StreamingMemoryTarget" in "config.ini")
+generates the same levels as the in-memory mode and reports the peak memory of
+both modes, as measured by tracemalloc.
+
+Usage:
+
+    python3 src/python/compare_streaming.py [polygon_svg_file ...] [--number-of-primary-blocks-on-x-axis N ...] [--memory-target MB]
+
+A small memory target (such as 0.01) makes the streaming mode use many bands
+even for small structures. The shapes in "BUILT_IN_SHAPES" are compared as
+well, before the SVGs, hence the check can be run without any SVG. The exit
+status is 1 if any of the levels differ.
+'''
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from hashlib import sha256
+import tracemalloc
+
+from structure import create_structure, get_polygon_from_svg
+from svg_path_to_polygon import get_multipolygon_from_rings
+
+BUILT_IN_SHAPES = {
+    # Two <polygon> elements that overlap, whose overlap is a hole according
+    # to the even-odd rule.
+    'overlapping_parts': [[(0, 0), (60, 0), (60, 60), (0, 60)],
+                          [(30, 30), (90, 30), (90, 90), (30, 90)]],
+    # A frame, whose hole spans many bands, so that its platforms and pigs are
+    # decided from rows of different bands.
+    'frame': [[(0, 0), (120, 0), (120, 200), (0, 200)],
+              [(20, 20), (100, 20), (100, 180), (20, 180)]],
+    # Steps, whose rows are not supported by the rows below them.
+    'steps': [[(0, 0), (200, 0), (200, 40), (150, 40), (150, 80), (100, 80),
+               (100, 120), (50, 120), (50, 160), (0, 160)]],
+}
+
+
+def get_xml_elements_and_peak_memory(shape, config, num_primary_blocks_on_x_axis):
+    tracemalloc.start()
+    try:
+        structure = create_structure('', shape, config, num_primary_blocks_on_x_axis=num_primary_blocks_on_x_axis)
+        # The elements are hashed as they are generated, so that the level is
+        # not kept in the memory while it is being measured.
+        xml_elements_hash = sha256()
+        for xml_element in structure.generate_xml_elements():
+            xml_elements_hash.update(xml_element.encode())
+        return xml_elements_hash.digest(), tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def get_shapes(svg_file_names):
+    '''Returns (name, shape) of the built-in shapes and of the SVGs.'''
+    shapes = [(name, get_multipolygon_from_rings(rings)) for name, rings in BUILT_IN_SHAPES.items()]
+    return shapes + [(svg_file_name, get_polygon_from_svg(svg_file_name)) for svg_file_name in svg_file_names]
+
+
+def compare_streaming(svg_file_names, config, resolutions, memory_target):
+    streaming_config = ConfigParser()
+    streaming_config.read_dict({'DEFAULT': dict(config['DEFAULT'])})
+    streaming_config.set('DEFAULT', 'StreamingMemoryTarget', str(memory_target))
+    config.remove_option('DEFAULT', 'StreamingMemoryTarget')
+    are_levels_same = True
+    for svg_file_name, shape in get_shapes(svg_file_names):
+        for num_primary_blocks_on_x_axis in resolutions:
+            xml_elements_hash, peak_memory = get_xml_elements_and_peak_memory(shape, config, num_primary_blocks_on_x_axis)
+            streaming_xml_elements_hash, streaming_peak_memory = get_xml_elements_and_peak_memory(shape,
+                                                                                                  streaming_config,
+                                                                                                  num_primary_blocks_on_x_axis)
+            is_level_same = xml_elements_hash == streaming_xml_elements_hash
+            are_levels_same &= is_level_same
+            print(f'{svg_file_name} {num_primary_blocks_on_x_axis:5} '
+                  f'{peak_memory / 2 ** 20:8.1f}MB {streaming_peak_memory / 2 ** 20:8.1f}MB '
+                  f'{"same" if is_level_same else "DIFFERENT"}')
+    return are_levels_same
+
+
+if __name__ == '__main__':
+    config = ConfigParser()
+    config.read('config.ini')
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('svg_file_names', nargs='*')
+    argument_parser.add_argument('--number-of-primary-blocks-on-x-axis',
+                                 type=int,
+                                 nargs='+',
+                                 default=[int(config.get('DEFAULT', 'NumberOfPrimaryBlocksOnXAxis'))])
+    argument_parser.add_argument('--memory-target',
+                                 type=float,
+                                 default=config.getfloat('DEFAULT', 'StreamingMemoryTarget', fallback=64))
+    arguments = argument_parser.parse_args()
+    config.set('DEFAULT', 'WriteIntermediateLevels', 'no')
+    if not compare_streaming(arguments.svg_file_names,
+                             config,
+                             arguments.number_of_primary_blocks_on_x_axis,
+                             arguments.memory_target):
+        exit(1)
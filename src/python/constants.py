@@ -4,6 +4,11 @@ BLOCK_REGISTRY = {
     'square_with_hole': Block('SquareHole', 0.85, 0.85),
     'tiny_square': Block('SquareTiny', 0.22, 0.22),
     'long_rectangle': Block('RectBig', 2.06, 0.22),
+    'small_square': Block('SquareSmall', 0.43, 0.43),
+    'tiny_rectangle': Block('RectTiny', 0.43, 0.22),
+    'small_rectangle': Block('RectSmall', 0.85, 0.22),
+    'medium_rectangle': Block('RectMedium', 1.68, 0.22),
+    'fat_rectangle': Block('RectFat', 0.85, 0.43),
     'pig': Block('BasicSmall', 0.5, 0.5),
 }
 
@@ -0,0 +1,320 @@
+from abc import ABC, abstractmethod
+
+import numpy
+from shapely.geometry import Polygon
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+
+
+class IndexedShape:
+    '''The parts (that is, the polygons of a MultiPolygon) of a shape in an
+    STRtree. Every part is prepared, so that a tile is tested only against the
+    parts whose bounding boxes intersect it, instead of all of the vertices of
+    the shape. The parts of a valid MultiPolygon do not overlap, hence the
+    intersection area of a tile with the shape is the sum of its intersection
+    areas with the parts, and a tile is in the shape only if it is in a single
+    part.
+    '''
+    def __init__(self, shape):
+        self.parts = list(getattr(shape, 'geoms', [shape]))
+        self.prepared_parts = [prep(part) for part in self.parts]
+        # The tree would not rule anything out for a single part.
+        self.tree = STRtree(self.parts) if len(self.parts) > 1 else None
+
+
+    def get_nearby_part_indices(self, tile):
+        if self.tree is None:
+            return [0]
+        return self.tree.query(tile).tolist()
+
+
+    def contains(self, tile, nearby_part_indices):
+        return any(self.prepared_parts[index].contains(tile) for index in nearby_part_indices)
+
+
+    def intersects(self, tile, nearby_part_indices):
+        return any(self.prepared_parts[index].intersects(tile) for index in nearby_part_indices)
+
+
+    def get_intersection_area(self, tile, nearby_part_indices):
+        return sum(tile.intersection(self.parts[index]).area for index in nearby_part_indices)
+
+
+    def is_tile_mostly_in_shape(self, tile):
+        '''Same as "CoverageEngine.is_tile_mostly_in_shape".'''
+        nearby_part_indices = self.get_nearby_part_indices(tile)
+        if self.contains(tile, nearby_part_indices):
+            return True
+        if not self.intersects(tile, nearby_part_indices):
+            return False
+        return self.get_intersection_area(tile, nearby_part_indices) > tile.area / 2
+
+
+class CoverageEngine(ABC):
+    '''We designate an area for the structure and we partition it into small,
+    equal tiles. The tiles can be of any size and shape but for simplicity, they
+    are usually square. The tiles represent the "primary blocks" that are
+    going to form the structure in the output.
+
+    A coverage engine determines, for every tile, whether more than half of the
+    tile is in the shape or not and returns the result as the occupancy grid.
+    The rows of the grid start from the top of the shape (that is, from the
+    minimum Y coordinate) and the columns start from the left of the shape.
+
+    If "first_row" is given, only the "num_rows" rows that start from that row
+    are returned, so that a large grid can be computed in bands.
+    '''
+    @staticmethod
+    def get_tile(x, y, tile_width, tile_height):
+        return Polygon([(x,y),
+                        (x + tile_width, y),
+                        (x + tile_width, y + tile_height),
+                        (x, y + tile_height)])
+
+
+    @staticmethod
+    def is_tile_mostly_in_shape(tile, shape):
+        '''Find the intersection area of the tile with the shape and if the
+        intersection area is greater than half of the tile area, then return
+        true. Otherwise, return false.
+        '''
+        return tile.intersection(shape).area > tile.area / 2
+
+
+    @abstractmethod
+    def get_blocks(self, shape, tile_width, tile_height, num_rows, num_columns, first_row=0):
+        pass
+
+
+class ExactCoverageEngine(CoverageEngine):
+    '''Intersects every tile with the shape. This is the reference engine.'''
+    def get_blocks(self, shape, tile_width, tile_height, num_rows, num_columns, first_row=0):
+        blocks = []
+        for row in range(first_row, first_row + num_rows):
+            blocks_in_row = []
+            y = shape.bounds[1] + row * tile_height
+            for column in range(num_columns):
+                x = shape.bounds[0] + column * tile_width
+                tile = self.get_tile(x, y, tile_width, tile_height)
+                blocks_in_row.append(self.is_tile_mostly_in_shape(tile, shape))
+            blocks.append(blocks_in_row)
+        return blocks
+
+
+class PreparedCoverageEngine(CoverageEngine):
+    '''Gives the same result as the exact engine. The difference is that the
+    tiles that are completely in the shape or completely out of the shape are
+    decided using prepared geometries, which is much cheaper than calculating
+    the intersection. Only the tiles on the boundary of the shape are
+    intersected, with the parts of the shape that are near them (refer to
+    "IndexedShape").
+    '''
+    def get_blocks(self, shape, tile_width, tile_height, num_rows, num_columns, first_row=0):
+        indexed_shape = IndexedShape(shape)
+        blocks = []
+        for row in range(first_row, first_row + num_rows):
+            blocks_in_row = []
+            y = shape.bounds[1] + row * tile_height
+            for column in range(num_columns):
+                x = shape.bounds[0] + column * tile_width
+                tile = self.get_tile(x, y, tile_width, tile_height)
+                blocks_in_row.append(indexed_shape.is_tile_mostly_in_shape(tile))
+            blocks.append(blocks_in_row)
+        return blocks
+
+
+class RasterCoverageEngine(CoverageEngine):
+    '''Approximates the area fraction of every tile by sampling a
+    "num_samples_per_axis" by "num_samples_per_axis" lattice of points in the
+    tile. Points are classified with the even-odd rule on scanlines, one
+    scanline per row of samples, so the cost is proportional to the number of
+    scanlines times the number of polygon edges instead of the number of tiles
+    times the number of polygon vertices.
+
+    Sampling is only an approximation. Hence, the tiles whose sampled area
+    fraction is within "1 / num_samples_per_axis" of the half are intersected
+    with the parts of the shape that are near them, just like the prepared
+    engine does. This way, the result is the same as the result of the exact
+    engine in practice.
+    '''
+    def __init__(self, num_samples_per_axis=8):
+        self.num_samples_per_axis = num_samples_per_axis
+
+
+    @staticmethod
+    def get_edges(shape):
+        polygons = getattr(shape, 'geoms', [shape])
+        rings = []
+        for polygon in polygons:
+            rings.append(polygon.exterior)
+            rings.extend(polygon.interiors)
+        edges = []
+        for ring in rings:
+            coordinates = numpy.asarray(ring.coords)
+            edges.append(numpy.hstack((coordinates[:-1], coordinates[1:])))
+        edges = numpy.vstack(edges)
+        # Horizontal edges never cross a scanline.
+        return edges[edges[:, 1] != edges[:, 3]]
+
+
+    @staticmethod
+    def get_crossings(edges, y):
+        '''Returns the sorted X coordinates where the scanline at "y" crosses
+        the edges.'''
+        y0, y1 = edges[:, 1], edges[:, 3]
+        crossing_edges = edges[(y0 <= y) != (y1 <= y)]
+        x0, y0, x1, y1 = crossing_edges.T
+        return numpy.sort(x0 + (y - y0) * (x1 - x0) / (y1 - y0))
+
+
+    def get_sampled_area_fractions(self, shape, tile_width, tile_height, num_rows, num_columns, first_row=0):
+        edges = self.get_edges(shape)
+        min_x, min_y = shape.bounds[0], shape.bounds[1]
+        sample_offsets = (numpy.arange(self.num_samples_per_axis) + .5) / self.num_samples_per_axis
+        sample_xs = (min_x + (numpy.arange(num_columns)[:, None] + sample_offsets) * tile_width).ravel()
+        samples_in_tiles = numpy.zeros((num_rows, num_columns), dtype=int)
+        for row in range(num_rows):
+            samples_in_row = numpy.zeros(num_columns * self.num_samples_per_axis, dtype=int)
+            for sample_offset in sample_offsets:
+                crossings = self.get_crossings(edges, min_y + (first_row + row + sample_offset) * tile_height)
+                samples_in_row += numpy.searchsorted(crossings, sample_xs) % 2
+            samples_in_tiles[row] = samples_in_row.reshape(num_columns, self.num_samples_per_axis).sum(axis=1)
+        return samples_in_tiles / self.num_samples_per_axis ** 2
+
+
+    def get_blocks(self, shape, tile_width, tile_height, num_rows, num_columns, first_row=0):
+        area_fractions = self.get_sampled_area_fractions(shape, tile_width, tile_height, num_rows, num_columns, first_row)
+        blocks = area_fractions > .5
+        ambiguous_tiles = numpy.nonzero(abs(area_fractions - .5) <= 1 / self.num_samples_per_axis)
+        if len(ambiguous_tiles[0]):
+            indexed_shape = IndexedShape(shape)
+        for row, column in zip(*ambiguous_tiles):
+            tile = self.get_tile(shape.bounds[0] + column * tile_width,
+                                 shape.bounds[1] + (first_row + row) * tile_height,
+                                 tile_width,
+                                 tile_height)
+            blocks[row, column] = indexed_shape.is_tile_mostly_in_shape(tile)
+        return blocks.tolist()
+
+
+class ProgressiveCoverageEngine(PreparedCoverageEngine):
+    '''Gives the same result as the exact engine and is meant to be used for
+    the same shape at many resolutions, from the coarsest to the finest. The
+    shape is prepared only once and the tiles that are proved to be completely
+    in or completely out of the shape are remembered for every resolution. A
+    tile that is covered only by remembered tiles that are completely in (or
+    completely out of) the shape is decided without testing it against the
+    shape again.
+    '''
+    # Tolerance of the tile boundaries, so that the floating point errors make
+    # the covering tiles more, not less.
+    EPSILON = 1e-9
+
+    def __init__(self):
+        self.shape_wkb = None
+        self.indexed_shape = None
+        self.known_grids = []
+
+
+    def prepare(self, shape):
+        '''Forgets the remembered tiles if the shape is a different one.'''
+        shape_wkb = shape.wkb
+        if shape_wkb != self.shape_wkb:
+            self.shape_wkb = shape_wkb
+            self.indexed_shape = IndexedShape(shape)
+            self.known_grids = []
+
+
+    @staticmethod
+    def get_prefix_sums(cells):
+        prefix_sums = numpy.zeros((cells.shape[0] + 1, cells.shape[1] + 1), dtype=numpy.int64)
+        numpy.cumsum(numpy.cumsum(cells, axis=0), axis=1, out=prefix_sums[1:, 1:])
+        return prefix_sums
+
+
+    @classmethod
+    def get_covering_ranges(cls, num_tiles, tile_size, known_tile_size, num_known_tiles):
+        '''Returns the ranges of the known tiles that cover every tile on an
+        axis and whether the known tiles cover the tile at all.'''
+        indices = numpy.arange(num_tiles)
+        starts = numpy.floor(indices * tile_size / known_tile_size - cls.EPSILON).astype(int)
+        ends = numpy.ceil((indices + 1) * tile_size / known_tile_size + cls.EPSILON).astype(int)
+        is_covered = (starts >= 0) & (ends <= num_known_tiles)
+        return numpy.clip(starts, 0, num_known_tiles), numpy.clip(ends, 0, num_known_tiles), is_covered
+
+
+    def get_known_tiles(self, tile_width, tile_height, num_rows, num_columns):
+        is_in_shape = numpy.zeros((num_rows, num_columns), dtype=bool)
+        is_out_of_shape = numpy.zeros((num_rows, num_columns), dtype=bool)
+        for known_tile_width, known_tile_height, in_shape_sums, out_of_shape_sums in self.known_grids:
+            known_num_rows, known_num_columns = in_shape_sums.shape[0] - 1, in_shape_sums.shape[1] - 1
+            row_starts, row_ends, are_rows_covered = self.get_covering_ranges(num_rows, tile_height, known_tile_height, known_num_rows)
+            column_starts, column_ends, are_columns_covered = self.get_covering_ranges(num_columns, tile_width, known_tile_width, known_num_columns)
+            row_starts, row_ends = row_starts[:, None], row_ends[:, None]
+            areas = (row_ends - row_starts) * (column_ends - column_starts)
+            is_covered = are_rows_covered[:, None] & are_columns_covered
+            for prefix_sums, is_known in ((in_shape_sums, is_in_shape), (out_of_shape_sums, is_out_of_shape)):
+                counts = (prefix_sums[row_ends, column_ends]
+                        - prefix_sums[row_starts, column_ends]
+                        - prefix_sums[row_ends, column_starts]
+                        + prefix_sums[row_starts, column_starts])
+                is_known |= is_covered & (counts == areas)
+        return is_in_shape, is_out_of_shape
+
+
+    def get_blocks(self, shape, tile_width, tile_height, num_rows, num_columns, first_row=0):
+        if first_row:
+            # The remembered tiles are of the grids that start from the top of
+            # the shape.
+            return super().get_blocks(shape, tile_width, tile_height, num_rows, num_columns, first_row)
+        self.prepare(shape)
+        is_in_shape, is_out_of_shape = self.get_known_tiles(tile_width, tile_height, num_rows, num_columns)
+        blocks = is_in_shape.copy()
+        for row, column in zip(*numpy.nonzero(~is_in_shape & ~is_out_of_shape)):
+            tile = self.get_tile(shape.bounds[0] + column * tile_width,
+                                 shape.bounds[1] + row * tile_height,
+                                 tile_width,
+                                 tile_height)
+            nearby_part_indices = self.indexed_shape.get_nearby_part_indices(tile)
+            if self.indexed_shape.contains(tile, nearby_part_indices):
+                blocks[row, column] = is_in_shape[row, column] = True
+            elif not self.indexed_shape.intersects(tile, nearby_part_indices):
+                is_out_of_shape[row, column] = True
+            else:
+                blocks[row, column] = (self.indexed_shape.get_intersection_area(tile, nearby_part_indices)
+                                       > tile.area / 2)
+        # A grid of the same tiles as a remembered one tells nothing new,
+        # hence it replaces that one instead of being added.
+        self.known_grids = [known_grid for known_grid in self.known_grids
+                            if known_grid[:2] != (tile_width, tile_height)]
+        self.known_grids.append((tile_width,
+                                 tile_height,
+                                 self.get_prefix_sums(is_in_shape),
+                                 self.get_prefix_sums(is_out_of_shape)))
+        return blocks.tolist()
+
+
+class BitmapCoverageEngine(CoverageEngine):
+    '''Decides the tiles of a BitmapShape (refer to "src/python/bitmap.py")
+    using the area of the foreground pixels in the tiles, instead of
+    intersecting the tiles with a polygon. Hence, it works only for the bitmap
+    shapes and it is not in the registry.
+    '''
+    def get_blocks(self, shape, tile_width, tile_height, num_rows, num_columns, first_row=0):
+        return (shape.get_area_fractions(tile_width, tile_height, num_rows, num_columns, first_row) > .5).tolist()
+
+
+COVERAGE_ENGINE_REGISTRY = {
+    'exact': ExactCoverageEngine,
+    'prepared': PreparedCoverageEngine,
+    'raster': RasterCoverageEngine,
+    'progressive': ProgressiveCoverageEngine,
+}
+
+
+def get_coverage_engine(name):
+    '''Returns a new engine, since an engine can remember the shapes that it
+    has seen (refer to "ProgressiveCoverageEngine"). The callers that want to
+    share the remembered tiles between structures, such as
+    "src/python/sweep.py", pass the same engine to all of them instead.'''
+    return COVERAGE_ENGINE_REGISTRY[name]()
@@ -1,6 +1,89 @@
-from sys import argv
+'''Denoises a black and white image.
 
+Usage:
+
+    python3 src/python/denoise_image.py input_image output_image [--mode exact|fast] [--tile-height N]
+
+The "exact" mode applies a median filter and then a Gaussian filter. The "fast"
+mode makes use of the fact that the input is a black and white image. The median
+of a black and white window is the majority of the window, which is calculated
+using an integral image instead of sorting every window. The image is processed
+in horizontal tiles, so that the memory used by the intermediate arrays is
+proportional to the tile height instead of the image height. The result is the
+same as the result of the "exact" mode for black and white images. The images
+that are not exactly black and white (for example, JPEG images) are thresholded
+at the middle intensity first.
+'''
+from argparse import ArgumentParser
+
+import numpy
 from imageio import imread, imwrite
 from scipy.ndimage import gaussian_filter, median_filter
 
-imwrite(argv[2], gaussian_filter(median_filter(imread(argv[1]), 10), 10))
+MEDIAN_FILTER_SIZE = 10
+GAUSSIAN_FILTER_SIGMA = 10
+GAUSSIAN_FILTER_TRUNCATE = 4.0
+'''The default of scipy.ndimage.gaussian_filter.'''
+DEFAULT_TILE_HEIGHT = 1024
+DENOISE_MODES = ('exact', 'fast')
+
+
+def majority_filter(image, size=MEDIAN_FILTER_SIZE):
+    '''Same as median_filter(image, size) for an image that consists of only
+    black and white pixels.'''
+    is_white = image > 127
+    # The window of scipy.ndimage.median_filter starts "size // 2" pixels
+    # before and the borders are mirrored, which is the "symmetric" mode of
+    # numpy.pad.
+    before = size // 2
+    after = size - 1 - before
+    padded_is_white = numpy.pad(is_white, ((before, after), (before, after)), mode='symmetric')
+    integral_image = numpy.zeros((padded_is_white.shape[0] + 1, padded_is_white.shape[1] + 1), dtype=numpy.int32)
+    numpy.cumsum(padded_is_white, axis=0, out=integral_image[1:, 1:])
+    numpy.cumsum(integral_image[1:, 1:], axis=1, out=integral_image[1:, 1:])
+    number_of_white_pixels = (integral_image[size:, size:]
+                            - integral_image[:-size, size:]
+                            - integral_image[size:, :-size]
+                            + integral_image[:-size, :-size])
+    # The median is the element with the index "size * size // 2" in the sorted
+    # window. It is white if there are at most that many black pixels.
+    is_median_white = number_of_white_pixels >= size * size - size * size // 2
+    return numpy.where(is_median_white, 255, 0).astype(image.dtype)
+
+
+def denoise_image_fast(image, tile_height=DEFAULT_TILE_HEIGHT):
+    if image.ndim == 3:
+        return numpy.stack([denoise_image_fast(image[..., channel], tile_height)
+                            for channel in range(image.shape[2])],
+                           axis=2)
+    # Every tile is processed together with the rows around it that affect
+    # it, so that the borders of the tiles do not affect the result.
+    halo = MEDIAN_FILTER_SIZE // 2 + int(GAUSSIAN_FILTER_TRUNCATE * GAUSSIAN_FILTER_SIGMA + .5)
+    denoised_image = numpy.empty_like(image)
+    for tile_start in range(0, image.shape[0], tile_height):
+        tile_end = min(tile_start + tile_height, image.shape[0])
+        halo_start = max(tile_start - halo, 0)
+        halo_end = min(tile_end + halo, image.shape[0])
+        denoised_tile = gaussian_filter(majority_filter(image[halo_start:halo_end]), GAUSSIAN_FILTER_SIGMA)
+        denoised_image[tile_start:tile_end] = denoised_tile[tile_start - halo_start:tile_end - halo_start]
+    return denoised_image
+
+
+def denoise_image(image, mode='exact'):
+    if mode == 'fast':
+        return denoise_image_fast(image)
+    return gaussian_filter(median_filter(image, MEDIAN_FILTER_SIZE), GAUSSIAN_FILTER_SIGMA)
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('input_image')
+    argument_parser.add_argument('output_image')
+    argument_parser.add_argument('--mode', choices=DENOISE_MODES, default='exact')
+    argument_parser.add_argument('--tile-height', type=int, default=DEFAULT_TILE_HEIGHT)
+    arguments = argument_parser.parse_args()
+    image = imread(arguments.input_image)
+    if arguments.mode == 'fast':
+        imwrite(arguments.output_image, denoise_image_fast(image, arguments.tile_height))
+    else:
+        imwrite(arguments.output_image, denoise_image(image))
@@ -0,0 +1,143 @@
+from configparser import ConfigParser
+from subprocess import run
+from sys import argv
+
+from imageio import imread, imwrite
+
+from bitmap import BitmapShape
+from cache import Cache, get_cache, get_or_compute
+from denoise_image import GAUSSIAN_FILTER_SIGMA, MEDIAN_FILTER_SIZE, denoise_image
+from metrics import Metrics, get_metrics
+from raster_to_vector import get_polygon, get_polygon_points, threshold_image
+from structure import create_structure, get_default_level_path, get_level_name, get_polygon_from_svg
+from svg_path_to_polygon import NUM_SAMPLES, convert_svg_path_to_polygon
+
+
+def run_command(*command):
+    run(command, check=True, capture_output=True)
+
+
+def get_intermediate_base_names(image_file_name):
+    '''Returns the base names of the black and white and the denoised images
+    and the extension of the image, just like "src/shell/raster-to-vector.sh"
+    names them.'''
+    base_name, extension = image_file_name.rsplit('.', 1)
+    black_and_white_base_name = base_name + '-black-and-white'
+    denoised_base_name = black_and_white_base_name + '-denoised'
+    return black_and_white_base_name, denoised_base_name, extension
+
+
+def get_black_and_white_image_using_imagemagick(image_file_name):
+    black_and_white_base_name, _, extension = get_intermediate_base_names(image_file_name)
+    run_command('convert', image_file_name, '-negate', '-threshold', '0', '-negate', f'{black_and_white_base_name}.{extension}')
+    return imread(f'{black_and_white_base_name}.{extension}')
+
+
+def get_denoised_image_using_imagemagick(image_file_name, denoise_mode='exact', metrics=None):
+    metrics = Metrics() if metrics is None else metrics
+    with metrics.measure('threshold'):
+        black_and_white_image = get_black_and_white_image_using_imagemagick(image_file_name)
+    with metrics.measure('denoise_image'):
+        return denoise_image(black_and_white_image, denoise_mode)
+
+
+def trace_image_using_potrace(image_file_name, denoised_image):
+    '''Returns the name of the SVG of Potrace.'''
+    _, denoised_base_name, extension = get_intermediate_base_names(image_file_name)
+    imwrite(f'{denoised_base_name}.{extension}', denoised_image)
+    run_command('mogrify', '-format', 'bmp', f'{denoised_base_name}.{extension}')
+    run_command('potrace', '-b', 'svg', f'{denoised_base_name}.bmp')
+    return f'{denoised_base_name}.svg'
+
+
+def trace_denoised_image_using_potrace(image_file_name, denoised_image, tolerance=None, metrics=None):
+    '''Returns the name of the polygon SVG.'''
+    metrics = Metrics() if metrics is None else metrics
+    with metrics.measure('trace'):
+        svg_file_name = trace_image_using_potrace(image_file_name, denoised_image)
+    with metrics.measure('svg_path_to_polygon'):
+        polygon_svg_file_name, _ = convert_svg_path_to_polygon(svg_file_name, tolerance)
+    return polygon_svg_file_name
+
+
+def raster_to_vector(image_file_name):
+    '''Does the same thing as "src/shell/raster-to-vector.sh" and returns the
+    name of the polygon SVG.'''
+    return trace_denoised_image_using_potrace(image_file_name,
+                                              get_denoised_image_using_imagemagick(image_file_name))
+
+
+def get_shape(image_file_name, config, cache=None, metrics=None):
+    '''Returns the name of the level and the shape of the structure. The
+    denoised image and the shape are taken from the cache if they are there,
+    in which case the stages that compute them are not in the metrics.'''
+    metrics = Metrics() if metrics is None else metrics
+    vectorizer = config.get('DEFAULT', 'Vectorizer', fallback='potrace')
+    denoise_mode = config.get('DEFAULT', 'DenoiseMode', fallback='exact')
+    tolerance = config.getfloat('DEFAULT', 'PathSamplingTolerance', fallback=None)
+    with open(image_file_name, 'rb') as image_file:
+        image_bytes = image_file.read()
+    denoised_image_key = Cache.get_key('denoised_image', image_bytes, vectorizer, denoise_mode, MEDIAN_FILTER_SIZE, GAUSSIAN_FILTER_SIGMA)
+    polygon_key = Cache.get_key('polygon', denoised_image_key, vectorizer, NUM_SAMPLES, tolerance)
+
+    if vectorizer in ('in_memory', 'bitmap'):
+        def compute_denoised_image():
+            with metrics.measure('threshold'):
+                black_and_white_image = threshold_image(imread(image_bytes))
+            with metrics.measure('denoise_image'):
+                return denoise_image(black_and_white_image, denoise_mode)
+        def compute_polygon():
+            denoised_image = get_or_compute(cache, 'denoised_image', denoised_image_key, compute_denoised_image)
+            if vectorizer == 'bitmap':
+                # The vectorization is skipped and the grid is computed from
+                # the denoised image. Refer to "src/python/bitmap.py".
+                with metrics.measure('get_bitmap_shape'):
+                    return BitmapShape(denoised_image)
+            with metrics.measure('trace'):
+                points = get_polygon_points(denoised_image, tolerance)
+            with metrics.measure('get_polygon'):
+                return get_polygon(points)
+        return get_level_name(image_file_name), get_or_compute(cache, 'polygon', polygon_key, compute_polygon)
+
+    def compute_denoised_image():
+        return get_denoised_image_using_imagemagick(image_file_name, denoise_mode, metrics)
+    def compute_polygon():
+        denoised_image = get_or_compute(cache, 'denoised_image', denoised_image_key, compute_denoised_image)
+        polygon_svg_file_name = trace_denoised_image_using_potrace(image_file_name, denoised_image, tolerance, metrics)
+        with metrics.measure('get_polygon_from_svg'):
+            return get_polygon_from_svg(polygon_svg_file_name)
+    _, denoised_base_name, _ = get_intermediate_base_names(image_file_name)
+    return get_level_name(denoised_base_name + '-polygon.svg'), get_or_compute(cache, 'polygon', polygon_key, compute_polygon)
+
+
+def generate_structure_for_image(image_file_name, config, get_level_path=None):
+    '''Writes the level and returns the structure. "get_level_path" is the
+    same as in "generate_structure_from_svg".'''
+    cache = get_cache(config)
+    metrics = get_metrics(config)
+    metrics.record(image=image_file_name)
+    if get_level_path is None:
+        get_level_path = lambda level_name: get_default_level_path(config, level_name)
+    try:
+        with metrics.profile():
+            level_name, shape = get_shape(image_file_name, config, cache, metrics)
+            structure = create_structure(get_level_path(level_name), shape, config, cache, metrics=metrics)
+            structure.write_level_to_file(structure.level_path + '.xml')
+        if config.getboolean('DEFAULT', 'WriteMetrics', fallback=False):
+            structure.write_metrics_to_file(structure.level_path + '.json')
+    finally:
+        if cache is not None:
+            cache.save_statistics()
+    return structure
+
+
+def generate_level(image_file_name, config):
+    '''Does the same thing as "src/shell/generate-level.sh" and returns the name
+    of the level file.'''
+    return generate_structure_for_image(image_file_name, config).level_path + '.xml'
+
+
+if __name__ == '__main__':
+    config = ConfigParser()
+    config.read('config.ini')
+    print(generate_level(argv[1], config))
@@ -0,0 +1,91 @@
+'''Generates a level for every image under a directory using a pool of worker
+processes. Every worker imports the libraries only once and a failure on an
+image does not stop the generation of the levels for the other images.
+
+Usage:
+
+    python3 src/python/generate_levels_for_images.py [image_directory] [--number-of-workers N]
+'''
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from configparser import ConfigParser
+from os import walk
+from os.path import join
+from subprocess import CalledProcessError
+
+from generate_level import generate_level
+
+IMAGE_DIRECTORY = 'Images/Edited'
+CONFIG_FILE_NAME = 'config.ini'
+
+config = None
+
+
+def get_image_file_names(image_directory):
+    '''The files with a "-" in their names are the intermediate files of the
+    previous runs. Hence, they are skipped.'''
+    image_file_names = []
+    for directory, _, file_names in walk(image_directory):
+        for file_name in file_names:
+            if file_name != '.DS_Store' and '-' not in file_name:
+                image_file_names.append(join(directory, file_name))
+    return sorted(image_file_names)
+
+
+def initialize_worker(config_file_name):
+    global config
+    config = ConfigParser()
+    config.read(config_file_name)
+
+
+def get_error_message(exception):
+    error_message = f'{type(exception).__name__}: {exception}'
+    if isinstance(exception, CalledProcessError) and exception.stderr:
+        error_message += ' ' + exception.stderr.decode(errors='replace').strip()
+    return error_message
+
+
+def generate_level_for_image(image_file_name):
+    '''Returns the name of the level file and the error message. One of them is
+    always None.'''
+    try:
+        return generate_level(image_file_name, config), None
+    except Exception as exception:
+        return None, get_error_message(exception)
+
+
+def generate_levels_for_images(image_file_names, number_of_workers, config_file_name=CONFIG_FILE_NAME):
+    '''Returns a dictionary of the images that failed to their error messages.'''
+    failures = {}
+    with ProcessPoolExecutor(number_of_workers,
+                             initializer=initialize_worker,
+                             initargs=(config_file_name,)) as executor:
+        futures = {executor.submit(generate_level_for_image, image_file_name): image_file_name
+                   for image_file_name in image_file_names}
+        for future in as_completed(futures):
+            image_file_name = futures[future]
+            level_file_name, error_message = future.result()
+            if error_message is None:
+                print(f'{image_file_name} -> {level_file_name}')
+            else:
+                print(f'{image_file_name} FAILED {error_message}')
+                failures[image_file_name] = error_message
+    return failures
+
+
+if __name__ == '__main__':
+    initialize_worker(CONFIG_FILE_NAME)
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('image_directory', nargs='?', default=IMAGE_DIRECTORY)
+    argument_parser.add_argument('--number-of-workers',
+                                 type=int,
+                                 default=config.getint('DEFAULT', 'NumberOfWorkers', fallback=None))
+    arguments = argument_parser.parse_args()
+
+    image_file_names = get_image_file_names(arguments.image_directory)
+    failures = generate_levels_for_images(image_file_names, arguments.number_of_workers)
+    print(f'{len(image_file_names) - len(failures)} of {len(image_file_names)} levels generated.')
+    for image_file_name in sorted(failures):
+        print(f'Failed: {image_file_name}: {failures[image_file_name]}')
+    if failures:
+        exit(1)
@@ -0,0 +1,177 @@
+import numpy
+
+
+class Grid:
+    '''The occupancy grid of the primary blocks of a structure. The cells are
+    stored once, in a NumPy bool array whose rows start from the bottom of the
+    structure and whose columns start from the left of the structure. The other
+    orientations are views of the same array, hence they are not copied and
+    the changes made through them are seen by all of them.
+
+    The grid keeps an index of every row: the prefix sums of the row and its
+    first and last occupied columns, so that the queries on the rows take
+    constant time. The cells must be changed using "set_cells", which updates
+    the index of the changed rows only.
+    '''
+    def __init__(self, cells):
+        self.cells = numpy.array(cells, dtype=bool, ndmin=2)
+        self.row_prefix_sums = numpy.zeros((self.num_rows, self.num_columns + 1),
+                                           dtype=numpy.min_scalar_type(self.num_columns))
+        self.first_occupied_columns = numpy.zeros(self.num_rows, dtype=int)
+        self.last_occupied_columns = numpy.zeros(self.num_rows, dtype=int)
+        self.update_row_index(slice(None))
+
+
+    @classmethod
+    def from_coverage(cls, blocks):
+        '''Creates the grid from the result of a coverage engine. That is, the
+        rows of "blocks" start from the top of the structure. The empty rows are
+        dropped.'''
+        cells = numpy.array(blocks, dtype=bool, ndmin=2)
+        return cls(cells[cells.any(axis=1)][::-1])
+
+
+    @classmethod
+    def from_packed(cls, packed_cells, num_rows, num_columns):
+        return cls(numpy.unpackbits(packed_cells, count=num_rows * num_columns).reshape(num_rows, num_columns))
+
+
+    def pack(self):
+        '''Returns the cells packed into bits, 8 cells per byte.'''
+        return numpy.packbits(self.cells)
+
+
+    @property
+    def num_rows(self):
+        return self.cells.shape[0]
+
+
+    @property
+    def num_columns(self):
+        return self.cells.shape[1]
+
+
+    @property
+    def rows(self):
+        '''Rows from the bottom to the top.'''
+        return self.cells
+
+
+    @property
+    def columns(self):
+        '''Columns from the left to the right, where every column goes from
+        the bottom to the top.'''
+        return self.cells.T
+
+
+    @property
+    def top_down_rows(self):
+        '''Rows from the top to the bottom, as the coverage engines return
+        them.'''
+        return self.cells[::-1]
+
+
+    def update_row_index(self, rows):
+        cells = self.cells[rows]
+        numpy.cumsum(cells, axis=1, out=self.row_prefix_sums[rows, 1:])
+        if self.num_columns:
+            self.first_occupied_columns[rows] = cells.argmax(axis=1)
+            self.last_occupied_columns[rows] = self.num_columns - 1 - cells[:, ::-1].argmax(axis=1)
+
+
+    def set_cells(self, rows, columns, value):
+        '''Same as "cells[rows, columns] = value", where "rows" is a slice.'''
+        self.cells[rows, columns] = value
+        self.update_row_index(rows)
+
+
+    def get_rows_with_unsupported_cells(self):
+        '''Returns the indices of the rows that have at least one occupied cell
+        with an empty cell under it.'''
+        return numpy.flatnonzero((self.cells[1:] & ~self.cells[:-1]).any(axis=1)) + 1
+
+
+    def any_in_row(self, row, start_column, end_column):
+        '''Same as "cells[row, start_column:end_column].any()" for a
+        non-negative "start_column".'''
+        end_column = min(end_column, self.num_columns)
+        if start_column >= end_column:
+            return False
+        return bool(self.row_prefix_sums[row, end_column] != self.row_prefix_sums[row, start_column])
+
+
+    def get_first_occupied_column(self, row):
+        return int(self.first_occupied_columns[row])
+
+
+    def get_last_occupied_column(self, row):
+        return int(self.last_occupied_columns[row])
+
+
+    def get_occupied_cells(self, excluded_cells=None):
+        '''Returns the column and row indices of the occupied cells, column by
+        column. The cells that are True in "excluded_cells" (an array of the
+        same shape as "rows") are skipped.'''
+        cells = self.cells if excluded_cells is None else self.cells & ~excluded_cells
+        columns, rows = numpy.nonzero(cells.T)
+        return zip(columns.tolist(), rows.tolist())
+
+
+    def to_string(self, marked_rows=()):
+        '''Draws the grid from the top to the bottom. The rows in "marked_rows"
+        are marked with an underscore.'''
+        index_width = len(str(self.num_rows - 1))
+        marked_rows = set(marked_rows)
+        drawn_rows = numpy.where(self.cells, '▉', ' ')
+        return '\n'.join(f'{index:{index_width}} ' + ('_' if index in marked_rows else ' ') + ''.join(drawn_row)
+                         for index, drawn_row in reversed(list(enumerate(drawn_rows.tolist()))))
+
+
+class BandedGrid(Grid):
+    '''Same as Grid but for the grids that are too large to be kept in the
+    memory more than once, such as the ones that are in a NumPy memmap. The
+    rows are not indexed. Instead, the queries on a row read that row, and the
+    queries on the whole grid read it in bands of "num_rows_per_band" rows or
+    "num_columns_per_band" columns, so that the memory that is used on top of
+    the cells is bounded by the size of a band.
+    '''
+    def __init__(self, cells, num_rows_per_band, num_columns_per_band):
+        self.cells = cells
+        self.num_rows_per_band = max(1, num_rows_per_band)
+        self.num_columns_per_band = max(1, num_columns_per_band)
+
+
+    def update_row_index(self, rows):
+        pass
+
+
+    def get_rows_with_unsupported_cells(self):
+        rows = [numpy.zeros(0, dtype=int)]
+        for start_row in range(1, self.num_rows, self.num_rows_per_band):
+            # The band starts one row lower to see the cells under its first
+            # row.
+            band = self.cells[start_row - 1:start_row + self.num_rows_per_band]
+            rows.append(numpy.flatnonzero((band[1:] & ~band[:-1]).any(axis=1)) + start_row)
+        return numpy.concatenate(rows)
+
+
+    def any_in_row(self, row, start_column, end_column):
+        return bool(self.cells[row, start_column:end_column].any())
+
+
+    def get_first_occupied_column(self, row):
+        return int(self.cells[row].argmax())
+
+
+    def get_last_occupied_column(self, row):
+        return self.num_columns - 1 - int(self.cells[row, ::-1].argmax())
+
+
+    def get_occupied_cells(self, excluded_cells=None):
+        for start_column in range(0, self.num_columns, self.num_columns_per_band):
+            columns = slice(start_column, start_column + self.num_columns_per_band)
+            cells = self.cells[:, columns]
+            if excluded_cells is not None:
+                cells = cells & ~excluded_cells[:, columns]
+            band_columns, band_rows = numpy.nonzero(cells.T)
+            yield from zip((band_columns + start_column).tolist(), band_rows.tolist())
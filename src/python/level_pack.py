@@ -0,0 +1,322 @@
+'''Stores many generated levels in one compact binary file, a level pack, instead
+of one Science Birds XML file per level. A level is kept as its occupancy grid,
+packed into bits, and the placements of its blocks and pigs, which is enough to
+write the same XML as "Structure.write_level_to_file" on demand.
+
+The pack is laid out as:
+
+1. The header ("HEADER"): the magic, the version, the number of levels and the
+offset of the index.
+2. The records of the levels, one after another. Every record starts with
+"LEVEL_HEADER" (the grid dimensions and the lengths of the arrays), followed by
+the names of the block types in "BLOCK_REGISTRY" (the primary block, the
+platform block and the merged blocks) and the arrays: the packed cells, the
+platforms, the number of platform blocks on every platform, the lateral
+distances of the platform blocks, the rows of the pigs, the number of pigs in
+every row, the indices of the pigs and the merged blocks.
+3. The index, which is the offset, the size and the name of every level, in the
+order in which they were added.
+
+All of the numbers are little endian and every array starts at a multiple of
+"ALIGNMENT" bytes. The pack is read through a NumPy memmap, hence opening a pack
+reads only its header and index, and a level is read only when it is asked for.
+
+Usage:
+
+    python3 src/python/level_pack.py pack pack_file image_or_polygon_svg_file ... [--number-of-primary-blocks-on-x-axis N ...]
+    python3 src/python/level_pack.py list pack_file
+    python3 src/python/level_pack.py export pack_file [level_name ...] [--output-directory D]
+
+"pack" generates the level of every file, using "config.ini", and writes them
+to the pack. The files that end with ".svg" are read as polygon SVGs and the
+other files are read as images. If more than one resolution is given, the levels
+are named "<level name>-<resolution>", just like "src/python/sweep.py" names
+them. "export" writes the given levels (all of them by default) to
+"<output directory>/<level name>.xml", where the output directory is "LevelPath"
+by default.
+'''
+from struct import Struct
+
+import numpy
+
+from block_merging import MergeCandidate
+from constants import BLOCK_REGISTRY
+from grid import Grid
+from structure import Structure
+
+MAGIC = b'SBLPACK\0'
+VERSION = 1
+HEADER = Struct('<8sIIQ')
+'''Magic, version, number of levels and offset of the index.'''
+INDEX_ENTRY = Struct('<QQH')
+'''Offset and size of the record and length of the name, which follows it.'''
+LEVEL_HEADER = Struct('<7I')
+'''Number of rows, columns, platforms, platform blocks, rows with pigs, pigs and
+merged blocks.'''
+ALIGNMENT = 8
+MERGED_BLOCK_FIELDS = 6
+'''Block type, rotation, number of columns, number of rows, column and row of
+every merged block.'''
+
+
+def get_padding(size):
+    return -size % ALIGNMENT
+
+
+def get_block_name(block):
+    return next(name for name, registered_block in BLOCK_REGISTRY.items() if registered_block is block)
+
+
+def get_level_record(structure):
+    '''Returns the record of the level of the structure, as bytes.'''
+    block_names = [get_block_name(structure.primary_block), get_block_name(structure.platform_block)]
+    merged_blocks = numpy.zeros((len(structure.merged_blocks), MERGED_BLOCK_FIELDS), dtype='<i4')
+    for merged_block, (candidate, column, row) in zip(merged_blocks, structure.merged_blocks):
+        block_name = get_block_name(candidate.block)
+        if block_name not in block_names:
+            block_names.append(block_name)
+        merged_block[:] = (block_names.index(block_name),
+                           candidate.rotation,
+                           candidate.num_columns,
+                           candidate.num_rows,
+                           column,
+                           row)
+    pig_indices = structure.pig_indices
+    arrays = [structure.grid.pack(),
+              numpy.array(structure.platforms, dtype='<i4'),
+              numpy.array([len(platform_blocks_of_row) for platform_blocks_of_row in structure.platform_blocks], dtype='<u4'),
+              numpy.array([lateral_distance
+                           for platform_blocks_of_row in structure.platform_blocks
+                           for lateral_distance in platform_blocks_of_row], dtype='<f8'),
+              numpy.array(list(pig_indices), dtype='<i4'),
+              numpy.array([len(pig_indices[row]) for row in pig_indices], dtype='<u4'),
+              numpy.array([index for row in pig_indices for index in pig_indices[row]], dtype='<i4'),
+              merged_blocks]
+    parts = [LEVEL_HEADER.pack(structure.grid.num_rows,
+                               structure.grid.num_columns,
+                               len(arrays[1]),
+                               len(arrays[3]),
+                               len(arrays[4]),
+                               len(arrays[6]),
+                               len(merged_blocks)),
+             bytes([len(block_names)])]
+    for block_name in block_names:
+        encoded_block_name = block_name.encode()
+        parts.append(bytes([len(encoded_block_name)]) + encoded_block_name)
+    size = sum(len(part) for part in parts)
+    for array in arrays:
+        parts.append(bytes(get_padding(size)))
+        size += get_padding(size)
+        parts.append(array.tobytes())
+        size += array.nbytes
+    return b''.join(parts)
+
+
+class LevelPackWriter:
+    '''Writes the levels to a new pack as they are added. The index is written
+    when the writer is closed.'''
+    def __init__(self, file_name):
+        self.file = open(file_name, 'wb')
+        self.index = {}
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+    def add(self, level_name, structure):
+        if level_name in self.index:
+            raise ValueError(f'The level "{level_name}" is already in the pack.')
+        self.file.write(bytes(get_padding(self.file.tell())))
+        record = get_level_record(structure)
+        self.index[level_name] = (self.file.tell(), len(record))
+        self.file.write(record)
+
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(bytes(get_padding(self.file.tell())))
+        index_offset = self.file.tell()
+        for level_name, (offset, size) in self.index.items():
+            encoded_level_name = level_name.encode()
+            self.file.write(INDEX_ENTRY.pack(offset, size, len(encoded_level_name)) + encoded_level_name)
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(self.index), index_offset))
+        self.file.close()
+
+
+class LevelPack:
+    '''Reads a pack through a memmap. The levels are read only when they are
+    asked for, using the index.'''
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.buffer = numpy.memmap(file_name, dtype=numpy.uint8, mode='r')
+        magic, version, num_levels, index_offset = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC:
+            raise ValueError(f'"{file_name}" is not a level pack.')
+        if version != VERSION:
+            raise ValueError(f'The version {version} of the level pack "{file_name}" is not supported.')
+        self.index = {}
+        for _ in range(num_levels):
+            offset, size, name_length = INDEX_ENTRY.unpack_from(self.buffer, index_offset)
+            index_offset += INDEX_ENTRY.size
+            self.index[bytes(self.buffer[index_offset:index_offset + name_length]).decode()] = (offset, size)
+            index_offset += name_length
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def __contains__(self, level_name):
+        return level_name in self.index
+
+
+    @property
+    def level_names(self):
+        return list(self.index)
+
+
+    def get_level_size(self, level_name):
+        return self.index[level_name][1]
+
+
+    def read_array(self, offset, dtype, count):
+        '''Returns the array at the offset, which is a view of the memmap, and
+        the offset of the next array.'''
+        offset += get_padding(offset)
+        end = offset + count * numpy.dtype(dtype).itemsize
+        return self.buffer[offset:end].view(dtype), end
+
+
+    def get_structure(self, level_name, level_path=None):
+        '''Returns the structure of the level, which can only be written,
+        inspected and checked. Refer to "Structure.from_placements".'''
+        if level_name not in self.index:
+            raise KeyError(f'There is no level "{level_name}" in "{self.file_name}".')
+        offset, _ = self.index[level_name]
+        (num_rows,
+         num_columns,
+         num_platforms,
+         num_platform_blocks,
+         num_pig_rows,
+         num_pigs,
+         num_merged_blocks) = LEVEL_HEADER.unpack_from(self.buffer, offset)
+        # The offsets of the arrays are aligned relative to the start of the
+        # record, which is aligned itself.
+        position = offset + LEVEL_HEADER.size
+        num_block_names = int(self.buffer[position])
+        position += 1
+        blocks = []
+        for _ in range(num_block_names):
+            name_length = int(self.buffer[position])
+            blocks.append(BLOCK_REGISTRY[bytes(self.buffer[position + 1:position + 1 + name_length]).decode()])
+            position += 1 + name_length
+        packed_cells, position = self.read_array(position, numpy.uint8, (num_rows * num_columns + 7) // 8)
+        platforms, position = self.read_array(position, '<i4', num_platforms)
+        platform_block_counts, position = self.read_array(position, '<u4', num_platforms)
+        lateral_distances, position = self.read_array(position, '<f8', num_platform_blocks)
+        pig_rows, position = self.read_array(position, '<i4', num_pig_rows)
+        pig_counts, position = self.read_array(position, '<u4', num_pig_rows)
+        pig_indices, position = self.read_array(position, '<i4', num_pigs)
+        merged_blocks, _ = self.read_array(position, '<i4', num_merged_blocks * MERGED_BLOCK_FIELDS)
+        grid = Grid.from_packed(packed_cells, num_rows, num_columns)
+        platform_blocks = numpy.split(lateral_distances, numpy.cumsum(platform_block_counts)[:-1]) if num_platforms else []
+        pig_indices_of_rows = numpy.split(pig_indices, numpy.cumsum(pig_counts)[:-1]) if num_pig_rows else []
+        merged_cells = numpy.zeros((num_rows, num_columns), dtype=bool) if num_merged_blocks else None
+        placed_merged_blocks = []
+        for block_index, rotation, merged_num_columns, merged_num_rows, column, row in merged_blocks.reshape(-1, MERGED_BLOCK_FIELDS).tolist():
+            # The shortfall is not stored, since it is used only to choose the
+            # blocks.
+            placed_merged_blocks.append((MergeCandidate(blocks[block_index], rotation, merged_num_columns, merged_num_rows, None),
+                                         column,
+                                         row))
+            merged_cells[row:row + merged_num_rows, column:column + merged_num_columns] = True
+        return Structure.from_placements(level_name if level_path is None else level_path,
+                                         grid,
+                                         blocks[0],
+                                         blocks[1],
+                                         platforms.tolist(),
+                                         [platform_blocks_of_row.tolist() for platform_blocks_of_row in platform_blocks],
+                                         {row: indices.tolist() for row, indices in zip(pig_rows.tolist(), pig_indices_of_rows)},
+                                         placed_merged_blocks,
+                                         merged_cells)
+
+
+    def export_level(self, level_name, file_path):
+        '''Writes the level to the file as Science Birds XML, which is the same
+        as the level that "Structure.write_level_to_file" wrote when the level
+        was generated.'''
+        self.get_structure(level_name, file_path.rsplit('.', 1)[0]).write_level_to_file(file_path)
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from configparser import ConfigParser
+    from os import makedirs
+    from os.path import join
+
+    from generate_level import get_shape
+    from generate_levels_for_images import get_error_message
+    from structure import create_structure, get_level_name, get_polygon_from_svg
+
+    config = ConfigParser()
+    config.read('config.ini')
+    argument_parser = ArgumentParser()
+    subparsers = argument_parser.add_subparsers(dest='command', required=True)
+    pack_parser = subparsers.add_parser('pack')
+    pack_parser.add_argument('pack_file_name')
+    pack_parser.add_argument('file_names', nargs='+')
+    pack_parser.add_argument('--number-of-primary-blocks-on-x-axis',
+                             type=int,
+                             nargs='+',
+                             default=[int(config.get('DEFAULT', 'NumberOfPrimaryBlocksOnXAxis'))])
+    list_parser = subparsers.add_parser('list')
+    list_parser.add_argument('pack_file_name')
+    export_parser = subparsers.add_parser('export')
+    export_parser.add_argument('pack_file_name')
+    export_parser.add_argument('level_names', nargs='*')
+    export_parser.add_argument('--output-directory', default=config.get('DEFAULT', 'LevelPath'))
+    arguments = argument_parser.parse_args()
+
+    if arguments.command == 'pack':
+        config.set('DEFAULT', 'WriteIntermediateLevels', 'no')
+        resolutions = arguments.number_of_primary_blocks_on_x_axis
+        failures = {}
+        with LevelPackWriter(arguments.pack_file_name) as level_pack_writer:
+            for file_name in arguments.file_names:
+                try:
+                    if file_name.endswith('.svg'):
+                        level_name, shape = get_level_name(file_name), get_polygon_from_svg(file_name)
+                    else:
+                        level_name, shape = get_shape(file_name, config)
+                    for resolution in resolutions:
+                        packed_level_name = level_name if len(resolutions) == 1 else f'{level_name}-{resolution}'
+                        structure = create_structure(packed_level_name, shape, config, None, resolution)
+                        structure.flag_or_reject_if_unstable()
+                        level_pack_writer.add(packed_level_name, structure)
+                        print(f'{file_name} -> {packed_level_name}')
+                except Exception as exception:
+                    print(f'{file_name} FAILED {get_error_message(exception)}')
+                    failures[file_name] = get_error_message(exception)
+        if failures:
+            exit(1)
+    elif arguments.command == 'list':
+        level_pack = LevelPack(arguments.pack_file_name)
+        for level_name in level_pack.level_names:
+            structure = level_pack.get_structure(level_name)
+            print(f'{level_name} {structure.grid.num_rows}x{structure.grid.num_columns} '
+                  f'{structure.get_number_of_objects()} objects {level_pack.get_level_size(level_name)} bytes')
+    else:
+        level_pack = LevelPack(arguments.pack_file_name)
+        makedirs(arguments.output_directory, exist_ok=True)
+        for level_name in arguments.level_names or level_pack.level_names:
+            level_file_name = join(arguments.output_directory, level_name + '.xml')
+            level_pack.export_level(level_name, level_file_name)
+            print(f'{level_name} -> {level_file_name}')
@@ -0,0 +1,69 @@
+'''Collects the metrics of the generation of a level: the time spent on every
+stage and other values such as the grid dimensions and the block counts. The
+metrics are written as a JSON file next to the level, if "WriteMetrics" is
+enabled in "config.ini".
+
+If "ProfileLevels" is enabled as well, the generation is profiled using cProfile
+and the profile is written next to the metrics with the ".prof" extension. You
+can inspect it using "python3 -m pstats level.prof".
+'''
+from cProfile import Profile
+from contextlib import contextmanager
+from json import dump
+from time import perf_counter
+
+
+class Metrics:
+    def __init__(self, profile=False):
+        self.timings = {}
+        self.values = {}
+        self.profiler = Profile() if profile else None
+
+
+    @contextmanager
+    def measure(self, stage):
+        '''Adds the time spent in the block to the time of the stage. Hence, the
+        time of a stage that is done more than once is the total time.'''
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0) + perf_counter() - start
+
+
+    @contextmanager
+    def profile(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+        try:
+            yield
+        finally:
+            if self.profiler is not None:
+                self.profiler.disable()
+
+
+    def record(self, **values):
+        self.values.update(values)
+
+
+    def write(self, file_name):
+        record = {'timings': self.timings, **self.values}
+        if self.profiler is not None:
+            profile_file_name = file_name.rsplit('.', 1)[0] + '.prof'
+            self.profiler.dump_stats(profile_file_name)
+            record['profile'] = profile_file_name
+        with open(file_name, 'w') as metrics_file:
+            dump(record, metrics_file, indent=2)
+
+
+def get_metrics(config):
+    return Metrics(config.getboolean('DEFAULT', 'ProfileLevels', fallback=False))
+
+
+def get_number_of_vertices(shape):
+    '''Returns None for the bitmap shapes, which have no vertices.'''
+    if not hasattr(shape, 'geoms') and not hasattr(shape, 'exterior'):
+        return None
+    polygons = getattr(shape, 'geoms', [shape])
+    return sum(len(polygon.exterior.coords) + sum(len(interior.coords) for interior in polygon.interiors)
+               for polygon in polygons)
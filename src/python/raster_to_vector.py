@@ -0,0 +1,246 @@
+'''Does the same thing as "src/shell/raster-to-vector.sh" followed by
+"get_polygon_from_svg", without writing any intermediate files. That is, the
+image is converted to black and white, denoised and traced in memory, and the
+result is the Shapely polygon of the structure.
+
+Potrace is replaced by a marching squares contour tracer, which traces the
+denoised image on the same level as Potrace does (that is, the half of the
+maximum intensity).
+
+Usage:
+
+    python3 src/python/raster_to_vector.py raster_input_image_file
+
+This writes the intermediate images and the polygon SVG next to the input image
+for debugging.
+'''
+from sys import argv
+
+import numpy
+from imageio import imread, imwrite
+from lxml import etree
+from shapely.affinity import rotate
+from shapely.geometry import LineString, Polygon
+
+from denoise_image import denoise_image
+from svg_path_to_polygon import NUM_SAMPLES
+
+POTRACE_SCALE = 10
+'''Potrace multiplies the pixel coordinates by 10 in the SVG it outputs.'''
+
+TRACING_LEVEL = 127.5
+
+# Segments of the marching squares cases. The corners of a cell are numbered as
+# top-left: 8, top-right: 4, bottom-right: 2 and bottom-left: 1 and the case of
+# a cell is the sum of the numbers of its corners that are in the shape. The
+# edges of a cell are numbered as top: 0, right: 1, bottom: 2 and left: 3. The
+# saddle cases (5 and 10) are resolved using the value at the center of the
+# cell. SADDLE_SEGMENTS is used when the center is in the shape.
+SEGMENTS = {
+    1: [(3, 2)], 2: [(2, 1)], 3: [(3, 1)], 4: [(0, 1)],
+    5: [(3, 2), (0, 1)], 6: [(0, 2)], 7: [(0, 3)], 8: [(0, 3)],
+    9: [(0, 2)], 10: [(0, 3), (2, 1)], 11: [(0, 1)], 12: [(3, 1)],
+    13: [(2, 1)], 14: [(3, 2)],
+}
+SADDLE_SEGMENTS = {
+    5: [(3, 0), (2, 1)],
+    10: [(0, 1), (3, 2)],
+}
+
+
+def threshold_image(image):
+    '''Does the same thing as
+    "convert image -negate -threshold 0 -negate black_and_white_image". That is,
+    only the pixels with the maximum intensity remain white and every other
+    pixel becomes black.'''
+    maximum_intensity = numpy.iinfo(image.dtype).max if image.dtype.kind in 'ui' else 1
+    if image.ndim == 3:
+        is_white = numpy.all(image[..., :3] == maximum_intensity, axis=2)
+    else:
+        is_white = image == maximum_intensity
+    return numpy.where(is_white, 255, 0).astype(numpy.uint8)
+
+
+def get_edge_crossings(image):
+    '''Returns the points where the tracing level crosses the horizontal and the
+    vertical edges between the pixel centers. The pixel center of the pixel on
+    row "i" and column "j" is (j + 0.5, i + 0.5).'''
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        horizontal_fractions = (TRACING_LEVEL - image[:, :-1]) / (image[:, 1:] - image[:, :-1])
+        vertical_fractions = (TRACING_LEVEL - image[:-1]) / (image[1:] - image[:-1])
+    rows, columns = numpy.indices(image.shape, dtype=float) + .5
+    horizontal_crossings = numpy.stack((columns[:, :-1] + horizontal_fractions, rows[:, :-1]), axis=-1)
+    vertical_crossings = numpy.stack((columns[:-1], rows[:-1] + vertical_fractions), axis=-1)
+    return numpy.concatenate((horizontal_crossings.reshape(-1, 2), vertical_crossings.reshape(-1, 2)))
+
+
+def get_segments(image):
+    '''Returns the segments of the contours as pairs of edge indices. The edge
+    indices are the indices of the points returned by get_edge_crossings.'''
+    height, width = image.shape
+    is_in_shape = image < TRACING_LEVEL
+    cases = (8 * is_in_shape[:-1, :-1]
+           + 4 * is_in_shape[:-1, 1:]
+           + 2 * is_in_shape[1:, 1:]
+           + 1 * is_in_shape[1:, :-1])
+    centers_in_shape = (image[:-1, :-1] + image[:-1, 1:] + image[1:, 1:] + image[1:, :-1]) / 4 < TRACING_LEVEL
+    rows, columns = numpy.indices(cases.shape)
+    number_of_horizontal_edges = height * (width - 1)
+    # Edge indices of the top, right, bottom and left edges of every cell.
+    cell_edges = numpy.stack((rows * (width - 1) + columns,
+                              number_of_horizontal_edges + rows * width + columns + 1,
+                              (rows + 1) * (width - 1) + columns,
+                              number_of_horizontal_edges + rows * width + columns),
+                             axis=-1)
+    segments = []
+    for case, case_segments in SEGMENTS.items():
+        is_case = cases == case
+        if case in SADDLE_SEGMENTS:
+            for segments_of_case, is_cell in ((case_segments, is_case & ~centers_in_shape),
+                                              (SADDLE_SEGMENTS[case], is_case & centers_in_shape)):
+                for edge_a, edge_b in segments_of_case:
+                    segments.append(cell_edges[is_cell][:, [edge_a, edge_b]])
+        else:
+            for edge_a, edge_b in case_segments:
+                segments.append(cell_edges[is_case][:, [edge_a, edge_b]])
+    return numpy.concatenate(segments)
+
+
+def get_rings(segments):
+    '''Links the segments into closed rings. Every edge crossing is shared by
+    exactly two segments since the image is padded with the background.'''
+    endpoints = segments.ravel()
+    order = numpy.argsort(endpoints, kind='stable')
+    partners = numpy.empty_like(order)
+    partners[order[0::2]] = order[1::2]
+    partners[order[1::2]] = order[0::2]
+    partners = partners.tolist()
+    endpoints = endpoints.tolist()
+    is_visited = [False] * len(segments)
+    rings = []
+    for first_segment in range(len(segments)):
+        if is_visited[first_segment]:
+            continue
+        ring = []
+        endpoint = 2 * first_segment
+        while not is_visited[endpoint // 2]:
+            is_visited[endpoint // 2] = True
+            ring.append(endpoints[endpoint])
+            # Go to the other end of the segment and then to the segment that
+            # shares that end.
+            endpoint = partners[endpoint ^ 1]
+        rings.append(ring)
+    return rings
+
+
+def trace_image(image):
+    '''Returns the contours of the dark regions of the image as a list of rings
+    in pixel coordinates, where Y increases towards down.'''
+    image = numpy.pad(image.astype(float), 1, constant_values=255)
+    edge_crossings = get_edge_crossings(image)
+    # Compensate for the padding.
+    return [edge_crossings[ring] - 1 for ring in get_rings(get_segments(image))]
+
+
+def get_ring_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return abs(numpy.dot(x, numpy.roll(y, -1)) - numpy.dot(y, numpy.roll(x, -1))) / 2
+
+
+def sample_ring(ring, num_samples=NUM_SAMPLES):
+    '''Samples the ring uniformly along its length, just like
+    svg_path_to_polygon.py samples the Potrace path. The first and the last
+    samples are the same point.'''
+    closed_ring = numpy.vstack((ring, ring[:1]))
+    distances = numpy.concatenate(([0], numpy.cumsum(numpy.hypot(*numpy.diff(closed_ring, axis=0).T))))
+    sample_distances = numpy.linspace(0, distances[-1], num_samples)
+    return numpy.stack((numpy.interp(sample_distances, distances, closed_ring[:, 0]),
+                        numpy.interp(sample_distances, distances, closed_ring[:, 1])),
+                       axis=-1)
+
+
+def simplify_ring(ring, tolerance):
+    '''Returns the closed ring simplified so that it deviates from the
+    original ring by at most the tolerance, given in the coordinates of the
+    Potrace SVG, just like the tolerance of svg_path_to_polygon.py.'''
+    closed_ring = numpy.vstack((ring, ring[:1]))
+    return numpy.asarray(LineString(closed_ring).simplify(tolerance / POTRACE_SCALE).coords)
+
+
+def get_polygon_points(denoised_image, tolerance=None):
+    '''Returns the points of the polygon in the coordinates of the Potrace SVG.
+    That is, the pixel coordinates are multiplied by 10 and Y increases towards
+    up. If a tolerance is given, the outline is simplified using the tolerance
+    instead of being sampled at "NUM_SAMPLES" points.'''
+    rings = trace_image(denoised_image)
+    if not rings:
+        raise ValueError('There is nothing to trace in the image.')
+    ring = max(rings, key=get_ring_area)
+    points = sample_ring(ring) if tolerance is None else simplify_ring(ring, tolerance)
+    points[:, 1] = denoised_image.shape[0] - points[:, 1]
+    return (points * POTRACE_SCALE).round(2)
+
+
+def get_svg_elements(width, height):
+    '''Returns the root and the group elements of an SVG that is laid out just
+    like the SVGs of Potrace.'''
+    root = etree.Element('svg',
+                         nsmap={None: 'http://www.w3.org/2000/svg'},
+                         width=f'{width}pt',
+                         height=f'{height}pt',
+                         viewBox=f'0 0 {width} {height}')
+    group_element = etree.SubElement(root,
+                                     'g',
+                                     transform=f'translate(0.000000,{height}) scale(0.100000,-0.100000)',
+                                     fill='#000000',
+                                     stroke='none')
+    return root, group_element
+
+
+def write_polygon_svg(file_name, points, width, height):
+    root, group_element = get_svg_elements(width, height)
+    etree.SubElement(group_element, 'polygon', points=' '.join(f'{x},{y}' for x, y in points.tolist()))
+    etree.ElementTree(root).write(file_name, pretty_print=True)
+
+
+def write_path_svg(file_name, rings, width, height):
+    '''Writes the traced rings as a <path> element made of lines, in the
+    coordinates of the Potrace SVG. Hence, the SVG can be given to
+    svg_path_to_polygon.py in place of the SVG of Potrace.'''
+    root, group_element = get_svg_elements(width, height)
+    subpaths = []
+    for ring in rings:
+        points = ring * POTRACE_SCALE
+        points[:, 1] = height * POTRACE_SCALE - points[:, 1]
+        subpaths.append('M' + ' L'.join(f'{x:.2f} {y:.2f}' for x, y in points.tolist()) + ' Z')
+    etree.SubElement(group_element, 'path', d=' '.join(subpaths))
+    etree.ElementTree(root).write(file_name, pretty_print=True)
+
+
+def get_polygon(points):
+    # Same as get_polygon_from_svg. Refer to it for the reason of rotation.
+    return rotate(Polygon(points.tolist()), 180)
+
+
+def get_polygon_from_denoised_image(denoised_image, tolerance=None):
+    return get_polygon(get_polygon_points(denoised_image, tolerance))
+
+
+def get_polygon_from_image(image, debug_base_name=None, denoise_mode='exact'):
+    '''The image can be the bytes of an image file or an array. If
+    "debug_base_name" is given, the intermediate images and the polygon SVG are
+    written using it as the base name of the files.'''
+    if isinstance(image, bytes):
+        image = imread(image)
+    black_and_white_image = threshold_image(numpy.asarray(image))
+    denoised_image = denoise_image(black_and_white_image, denoise_mode)
+    points = get_polygon_points(denoised_image)
+    if debug_base_name is not None:
+        imwrite(debug_base_name + '-black-and-white.png', black_and_white_image)
+        imwrite(debug_base_name + '-denoised.png', denoised_image)
+        write_polygon_svg(debug_base_name + '-polygon.svg', points, *denoised_image.shape[::-1])
+    return get_polygon(points)
+
+
+if __name__ == '__main__':
+    get_polygon_from_image(imread(argv[1]), argv[1].rsplit('.', 1)[0])
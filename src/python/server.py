@@ -0,0 +1,283 @@
+'''Generates levels on demand without paying for starting Python and importing
+the libraries for every level. The server keeps a pool of worker processes that
+have imported and warmed up everything, and runs the jobs on them.
+
+Usage:
+
+    python3 src/python/server.py [--socket [socket_file]] [--number-of-workers N] [--max-pending-jobs M]
+
+If "--socket" is given, the server listens on that Unix socket ("server.sock" by
+default). Otherwise, it reads the jobs from the standard input and writes the
+results to the standard output. Either way, every job and every result is a line
+of JSON. A job is:
+
+    {"id": 1, "image": "Images/Edited/Animals/Cat.jpg", "config": {"NumberOfPrimaryBlocksOnXAxis": "40"}, "return_xml": true}
+
+where "id", "config" and "return_xml" are optional, and "svg" (the name of a
+polygon SVG) can be given instead of "image". "config" overrides the keys of the
+DEFAULT section of "config.ini". The result is:
+
+    {"id": 1, "level": "path/to/level-40-x1y2z3.xml", "xml": "<?xml ..."}
+
+or {"id": 1, "error": "..."} if the job failed. "xml" is there only if
+"return_xml" is true. The jobs run concurrently, hence the results can be in a
+different order than the jobs. The relative file names are relative to the
+working directory of the server.
+
+Every job has its own level file, whose name is the level name, the number of
+primary blocks on X axis and a unique suffix, so that the concurrent jobs on the
+same image never overwrite each other's levels. The intermediate files of an
+image job are written to a temporary directory of the job, which is removed when
+the job is completed.
+
+If a worker dies (for example, if it is killed for using too much memory), the
+jobs that were running fail and the workers are started again for the next jobs.
+
+At most "--max-pending-jobs" jobs are accepted at once. When there are that many
+jobs, the server stops reading new jobs until one of them is completed, so that
+the clients are slowed down instead of the jobs piling up in the memory.
+
+Use "src/python/client.py" (or "src/shell/request-level.sh") to send jobs to the
+server.
+'''
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from configparser import ConfigParser
+from json import dumps, loads
+from os import close, remove, symlink
+from os.path import abspath, basename, dirname, exists, join
+from signal import SIGTERM, default_int_handler, signal
+from socketserver import StreamRequestHandler, ThreadingUnixStreamServer
+from sys import stdin, stdout
+from tempfile import TemporaryDirectory, mkstemp
+from threading import BoundedSemaphore, Condition, Lock
+
+from client import DEFAULT_SOCKET_PATH
+from generate_level import generate_structure_for_image
+from generate_levels_for_images import get_error_message
+from structure import generate_structure_from_svg, get_default_level_path
+
+CONFIG_FILE_NAME = 'config.ini'
+DEFAULT_MAX_PENDING_JOBS = 64
+
+config = None
+
+
+def warm_up():
+    '''Runs the parts of the pipeline that are slow on their first run, such
+    as the lazy imports of the libraries, on a tiny input.'''
+    import numpy
+    from shapely.geometry import box
+    from svgpathtools import parse_path
+
+    from coverage import COVERAGE_ENGINE_REGISTRY, get_coverage_engine
+    from denoise_image import denoise_image
+    from raster_to_vector import get_polygon_points
+    from svg_path_to_polygon import sample_subpaths
+
+    # The square has to be large enough to survive denoising.
+    image = numpy.full((128, 128), 255, dtype=numpy.uint8)
+    image[32:96, 32:96] = 0
+    for mode in ('exact', 'fast'):
+        get_polygon_points(denoise_image(image, mode))
+    sample_subpaths(parse_path('M 0 0 C 10 0 10 10 0 10 Z').continuous_subpaths())
+    for engine_name in COVERAGE_ENGINE_REGISTRY:
+        get_coverage_engine(engine_name).get_blocks(box(0, 0, 4, 4), 1, 1, 4, 4)
+
+
+def initialize_worker(config_file_name):
+    global config
+    config = ConfigParser()
+    config.read(config_file_name)
+    warm_up()
+
+
+def get_job_config(overrides):
+    job_config = ConfigParser()
+    job_config.read_dict({'DEFAULT': dict(config['DEFAULT'])})
+    for key, value in overrides.items():
+        job_config.set('DEFAULT', key, str(value))
+    return job_config
+
+
+def get_job_level_path(job_config, level_name):
+    '''Returns a level path that no other job uses. The level file is
+    created, so that the other jobs cannot take the same name.'''
+    level_path = get_default_level_path(job_config, level_name)
+    resolution = job_config.get('DEFAULT', 'NumberOfPrimaryBlocksOnXAxis')
+    level_file_descriptor, level_file_name = mkstemp(suffix='.xml',
+                                                     prefix=f'{basename(level_path)}-{resolution}-',
+                                                     dir=dirname(level_path) or '.')
+    close(level_file_descriptor)
+    return level_file_name[:-len('.xml')]
+
+
+def run_job(job):
+    '''Runs on a worker and returns the result of the job.'''
+    result = {'id': job.get('id')}
+    try:
+        job_config = get_job_config(job.get('config', {}))
+        get_level_path = lambda level_name: get_job_level_path(job_config, level_name)
+        if 'image' in job:
+            # The intermediate files are written next to the image, hence the
+            # image is linked into a directory of the job.
+            with TemporaryDirectory() as job_directory:
+                image_file_name = join(job_directory, basename(job['image']))
+                symlink(abspath(job['image']), image_file_name)
+                structure = generate_structure_for_image(image_file_name, job_config, get_level_path)
+        elif 'svg' in job:
+            structure = generate_structure_from_svg(job['svg'], job_config, get_level_path)
+        else:
+            raise ValueError('The job has neither an "image" nor an "svg".')
+        result['level'] = structure.level_path + '.xml'
+        if job.get('return_xml'):
+            result['xml'] = structure.get_level_xml()
+    except Exception as exception:
+        result['error'] = get_error_message(exception)
+    return result
+
+
+class JobRunner:
+    '''Submits the jobs to the workers, allowing at most "max_pending_jobs"
+    jobs at once.'''
+    def __init__(self, number_of_workers, max_pending_jobs, config_file_name=CONFIG_FILE_NAME):
+        self.number_of_workers = number_of_workers
+        self.config_file_name = config_file_name
+        self.executor = self.create_executor()
+        self.executor_lock = Lock()
+        self.pending_jobs = BoundedSemaphore(max_pending_jobs)
+
+
+    def create_executor(self):
+        return ProcessPoolExecutor(self.number_of_workers,
+                                   initializer=initialize_worker,
+                                   initargs=(self.config_file_name,))
+
+
+    def submit_to_executor(self, job):
+        '''If a worker died, the executor is broken and the jobs that were
+        running on it fail. Then, the executor is replaced, so that the next
+        jobs run on new workers.'''
+        with self.executor_lock:
+            try:
+                return self.executor.submit(run_job, job)
+            except BrokenProcessPool:
+                self.executor.shutdown(wait=False)
+                self.executor = self.create_executor()
+                return self.executor.submit(run_job, job)
+
+
+    def submit(self, line, write_result, pending_futures, pending_futures_changed):
+        '''Blocks while there are "max_pending_jobs" jobs. The result is given
+        to "write_result" once the job is completed. The future of the job is in
+        "pending_futures" until then.'''
+        try:
+            job = loads(line)
+            if not isinstance(job, dict):
+                raise ValueError('The job is not a JSON object.')
+        except ValueError as exception:
+            write_result({'id': None, 'error': get_error_message(exception)})
+            return
+        self.pending_jobs.acquire()
+        try:
+            future = self.submit_to_executor(job)
+        except Exception as exception:
+            self.pending_jobs.release()
+            write_result({'id': job.get('id'), 'error': get_error_message(exception)})
+            return
+        with pending_futures_changed:
+            pending_futures.add(future)
+        def complete(future):
+            if future.exception() is None:
+                write_result(future.result())
+            else:
+                write_result({'id': job.get('id'), 'error': get_error_message(future.exception())})
+            self.pending_jobs.release()
+            with pending_futures_changed:
+                pending_futures.discard(future)
+                pending_futures_changed.notify_all()
+        future.add_done_callback(complete)
+
+
+    def run_lines(self, lines, output_file):
+        '''Runs a job for every non-empty line and writes the results to the
+        output file as they are completed. Returns when all of the jobs are
+        completed.'''
+        output_lock = Lock()
+        def write_result(result):
+            with output_lock:
+                try:
+                    output_file.write(dumps(result) + '\n')
+                    output_file.flush()
+                except (OSError, ValueError):
+                    # The client is gone. The job is completed anyway.
+                    pass
+        pending_futures = set()
+        pending_futures_changed = Condition()
+        for line in lines:
+            if line.strip():
+                self.submit(line, write_result, pending_futures, pending_futures_changed)
+        with pending_futures_changed:
+            pending_futures_changed.wait_for(lambda: not pending_futures)
+
+
+    def shutdown(self):
+        with self.executor_lock:
+            self.executor.shutdown()
+
+
+class TextWriter:
+    '''Writes text to a binary file of a socket.'''
+    def __init__(self, binary_file):
+        self.binary_file = binary_file
+
+
+    def write(self, text):
+        self.binary_file.write(text.encode())
+
+
+    def flush(self):
+        self.binary_file.flush()
+
+
+class JobRequestHandler(StreamRequestHandler):
+    def handle(self):
+        self.server.job_runner.run_lines((line.decode() for line in self.rfile), TextWriter(self.wfile))
+
+
+def serve_on_socket(job_runner, socket_path):
+    if exists(socket_path):
+        remove(socket_path)
+    # Stop the server the same way for SIGTERM as for SIGINT, so that the
+    # socket file is removed.
+    signal(SIGTERM, default_int_handler)
+    with ThreadingUnixStreamServer(socket_path, JobRequestHandler) as server:
+        server.job_runner = job_runner
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            remove(socket_path)
+
+
+if __name__ == '__main__':
+    main_config = ConfigParser()
+    main_config.read(CONFIG_FILE_NAME)
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('--socket', nargs='?', const=DEFAULT_SOCKET_PATH)
+    argument_parser.add_argument('--number-of-workers',
+                                 type=int,
+                                 default=main_config.getint('DEFAULT', 'NumberOfWorkers', fallback=None))
+    argument_parser.add_argument('--max-pending-jobs', type=int, default=DEFAULT_MAX_PENDING_JOBS)
+    arguments = argument_parser.parse_args()
+
+    job_runner = JobRunner(arguments.number_of_workers, arguments.max_pending_jobs)
+    try:
+        if arguments.socket is None:
+            job_runner.run_lines(stdin, stdout)
+        else:
+            serve_on_socket(job_runner, arguments.socket)
+    finally:
+        job_runner.shutdown()
@@ -0,0 +1,227 @@
+'''Checks whether the blocks and the pigs of a structure are supported, without
+loading the level in Science Birds. The check works on the grid, the platforms
+and the platform blocks of a Structure, before its level is written.
+
+The support graph is built from the bottom row to the top, one row at a time,
+and every row is checked at once using NumPy:
+
+1. A primary block in a row without a platform is supported if the primary
+block under it is supported. The primary blocks in the bottom row stand on the
+ground.
+2. A primary block in a row with a platform stands on the platform blocks of
+that row, hence it is supported if its center is on a stable platform block.
+3. A platform block is stable if the center of mass of the block and the
+primary blocks that stand on it is between the left edge of the leftmost and
+the right edge of the rightmost supported primary block under it. All of the
+blocks are of the same material, hence their masses are proportional to their
+areas. The platform blocks in the bottom row stand on the ground.
+4. A pig stands on the bottom of its cavity, hence it is supported if there is
+a supported primary block under its center, or a stable platform block if there
+is a platform at the bottom of its cavity.
+
+A block on an unsupported block is unsupported as well, hence only the blocks
+that are on the ground through the support graph are supported.
+
+If "StabilityCheck" is "flag" in "config.ini", the problems are recorded in the
+metrics and printed on the standard error when the level is written. If it is
+"reject", the level is not written and an UnstableLevelError is raised instead.
+
+Usage:
+
+    python3 src/python/stability.py image_or_polygon_svg_file ... [--number-of-primary-blocks-on-x-axis N ...]
+
+prints the problems of the level of every file and exits with status 1 if any
+of the levels are unstable. The files that end with ".svg" are read as polygon
+SVGs and the other files are read as images.
+'''
+import numpy
+
+STABILITY_CHECKS = ('no', 'flag', 'reject')
+
+# Tolerance of the comparisons of the positions, which are floating point.
+EPSILON = 1e-9
+
+
+class StabilityReport:
+    def __init__(self):
+        self.unsupported_cells = []
+        '''(column, row) of the unsupported primary blocks in the grid.'''
+        self.unstable_platform_blocks = []
+        '''(platform, lateral distance) of the unstable platform blocks.'''
+        self.unsupported_pigs = []
+        '''(platform, index) of the unsupported pigs, where the platform is the
+        one above the pig, just like in "Structure.pig_indices".'''
+
+
+    @property
+    def is_stable(self):
+        return not (self.unsupported_cells or self.unstable_platform_blocks or self.unsupported_pigs)
+
+
+    def to_dict(self):
+        return {'unsupported_cells': self.unsupported_cells,
+                'unstable_platform_blocks': self.unstable_platform_blocks,
+                'unsupported_pigs': self.unsupported_pigs}
+
+
+    def __str__(self):
+        if self.is_stable:
+            return 'stable'
+        return (f'{len(self.unsupported_cells)} unsupported primary blocks {self.unsupported_cells[:10]}, '
+                f'{len(self.unstable_platform_blocks)} unstable platform blocks {self.unstable_platform_blocks[:10]}, '
+                f'{len(self.unsupported_pigs)} unsupported pigs {self.unsupported_pigs[:10]}')
+
+
+class UnstableLevelError(ValueError):
+    def __init__(self, level_path, report):
+        super().__init__(f'The level "{level_path}" is unstable: {report}')
+        self.report = report
+
+
+def get_columns_on_platform_blocks(lateral_distances, platform_block_width, num_columns, primary_block_width):
+    '''Returns the start and the end (exclusive) columns of the cells whose
+    centers are on every platform block.'''
+    start_columns = numpy.ceil((lateral_distances - platform_block_width / 2) / primary_block_width - .5 - EPSILON)
+    end_columns = numpy.floor((lateral_distances + platform_block_width / 2) / primary_block_width - .5 + EPSILON) + 1
+    return (numpy.clip(start_columns, 0, num_columns).astype(int),
+            numpy.clip(end_columns, 0, num_columns).astype(int))
+
+
+def get_centers_of_mass(lateral_distances, cells, platform_block, primary_block):
+    '''Returns the center of mass of every platform block and the primary
+    blocks in "cells" (the row of the platform) that stand on it, in
+    columns.'''
+    start_columns, end_columns = get_columns_on_platform_blocks(lateral_distances,
+                                                                platform_block.width,
+                                                                len(cells),
+                                                                primary_block.width)
+    cell_counts = numpy.concatenate(([0], numpy.cumsum(cells)))
+    cell_moments = numpy.concatenate(([0.], numpy.cumsum(cells * (numpy.arange(len(cells)) + .5))))
+    platform_block_mass = (platform_block.width * platform_block.height) / (primary_block.width * primary_block.height)
+    masses = platform_block_mass + cell_counts[end_columns] - cell_counts[start_columns]
+    moments = (platform_block_mass * lateral_distances / primary_block.width
+               + cell_moments[end_columns] - cell_moments[start_columns])
+    return moments / masses
+
+
+def get_stable_platform_blocks(lateral_distances, cells, platform_block, supported_cells_below, primary_block):
+    '''Returns whether every platform block is stable. "supported_cells_below"
+    is None for the platform on the ground.'''
+    platform_block_width = platform_block.width
+    primary_block_width = primary_block.width
+    if supported_cells_below is None:
+        return numpy.ones(len(lateral_distances), dtype=bool)
+    supporting_columns = numpy.flatnonzero(supported_cells_below)
+    if not len(supporting_columns):
+        return numpy.zeros(len(lateral_distances), dtype=bool)
+    # The columns of the cells that are under the blocks, where the end is
+    # exclusive.
+    start_columns = numpy.floor((lateral_distances - platform_block_width / 2) / primary_block_width + EPSILON)
+    end_columns = numpy.ceil((lateral_distances + platform_block_width / 2) / primary_block_width - EPSILON)
+    first_supports = numpy.searchsorted(supporting_columns, start_columns)
+    last_supports = numpy.searchsorted(supporting_columns, end_columns) - 1
+    is_supported = first_supports <= last_supports
+    first_supports = supporting_columns[numpy.minimum(first_supports, len(supporting_columns) - 1)]
+    last_supports = supporting_columns[numpy.maximum(last_supports, 0)]
+    centers = get_centers_of_mass(lateral_distances, cells, platform_block, primary_block)
+    return is_supported & (first_supports - EPSILON <= centers) & (centers <= last_supports + 1 + EPSILON)
+
+
+def get_cells_on_platform_blocks(lateral_distances, platform_block_width, num_columns, primary_block_width):
+    '''Returns whether the center of every cell of a row is on one of the
+    platform blocks.'''
+    start_columns, end_columns = get_columns_on_platform_blocks(lateral_distances,
+                                                                platform_block_width,
+                                                                num_columns,
+                                                                primary_block_width)
+    changes = numpy.zeros(num_columns + 1, dtype=int)
+    numpy.add.at(changes, start_columns, 1)
+    numpy.add.at(changes, end_columns, -1)
+    return numpy.cumsum(changes[:-1]) > 0
+
+
+def is_supported_under(supported_cells, positions):
+    '''Returns whether there is a supported cell under every position, which is
+    in columns. A position on the boundary of two cells is on both of them.'''
+    num_columns = len(supported_cells)
+    is_supported = numpy.zeros(len(positions), dtype=bool)
+    for columns in (numpy.floor(positions - EPSILON).astype(int), numpy.floor(positions + EPSILON).astype(int)):
+        is_in_grid = (columns >= 0) & (columns < num_columns)
+        is_supported[is_in_grid] |= supported_cells[columns[is_in_grid]]
+    return is_supported
+
+
+def check_stability(structure):
+    '''Returns the StabilityReport of the structure. Only two rows of the
+    support graph are kept at once.'''
+    grid = structure.grid
+    primary_block_width = structure.primary_block.width
+    platform_block_width = structure.platform_block.width
+    platform_blocks = {platform: numpy.array(lateral_distances, dtype=float)
+                       for platform, lateral_distances in zip(structure.platforms, structure.platform_blocks)}
+    pig_height = structure.num_primary_blocks_to_cover_pig_height
+    lateral_distance_correction_index = .5 if structure.num_primary_blocks_to_cover_pig_width % 2 == 0 else 0
+    pigs_by_bottom_row = {}
+    for platform, indices in structure.pig_indices.items():
+        pigs_by_bottom_row.setdefault(platform - pig_height, []).extend((platform, index) for index in indices)
+    report = StabilityReport()
+    supported_cells_below = None
+    for row in range(grid.num_rows + 1):
+        cells = numpy.asarray(grid.rows[row], dtype=bool) if row < grid.num_rows else numpy.zeros(grid.num_columns, dtype=bool)
+        if row in platform_blocks:
+            lateral_distances = platform_blocks[row]
+            is_stable = get_stable_platform_blocks(lateral_distances,
+                                                   cells,
+                                                   structure.platform_block,
+                                                   supported_cells_below,
+                                                   structure.primary_block)
+            report.unstable_platform_blocks.extend((row, lateral_distance)
+                                                   for lateral_distance in lateral_distances[~is_stable].tolist())
+            support = get_cells_on_platform_blocks(lateral_distances[is_stable],
+                                                   platform_block_width,
+                                                   grid.num_columns,
+                                                   primary_block_width)
+        elif supported_cells_below is None:
+            support = numpy.ones(grid.num_columns, dtype=bool)
+        else:
+            support = supported_cells_below
+        if row in pigs_by_bottom_row:
+            pigs = pigs_by_bottom_row[row]
+            pig_centers = numpy.array([index + lateral_distance_correction_index + .5 for _, index in pigs])
+            report.unsupported_pigs.extend(pig
+                                           for pig, is_supported in zip(pigs, is_supported_under(support, pig_centers))
+                                           if not is_supported)
+        report.unsupported_cells.extend((column, row) for column in numpy.flatnonzero(cells & ~support).tolist())
+        supported_cells_below = cells & support
+    return report
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+    from configparser import ConfigParser
+
+    from generate_level import get_shape
+    from structure import create_structure, get_level_name, get_polygon_from_svg
+
+    config = ConfigParser()
+    config.read('config.ini')
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('file_names', nargs='+')
+    argument_parser.add_argument('--number-of-primary-blocks-on-x-axis',
+                                 type=int,
+                                 nargs='+',
+                                 default=[int(config.get('DEFAULT', 'NumberOfPrimaryBlocksOnXAxis'))])
+    arguments = argument_parser.parse_args()
+    config.set('DEFAULT', 'WriteIntermediateLevels', 'no')
+    are_levels_stable = True
+    for file_name in arguments.file_names:
+        if file_name.endswith('.svg'):
+            level_name, shape = get_level_name(file_name), get_polygon_from_svg(file_name)
+        else:
+            level_name, shape = get_shape(file_name, config)
+        for num_primary_blocks_on_x_axis in arguments.number_of_primary_blocks_on_x_axis:
+            report = check_stability(create_structure(level_name, shape, config, None, num_primary_blocks_on_x_axis))
+            are_levels_stable &= report.is_stable
+            print(f'{file_name} {num_primary_blocks_on_x_axis:5} {report}')
+    if not are_levels_stable:
+        exit(1)
@@ -1,10 +1,11 @@
 from bisect import bisect_left
 from configparser import ConfigParser
-from sys import argv
+from sys import argv, stderr
+from tempfile import TemporaryFile
 
+import numpy
 from lxml import etree
 from shapely.affinity import rotate
-from shapely.geometry import Polygon
 
 from constants import (BLOCK_REGISTRY,
                        MULTIPLIER,
@@ -12,6 +13,14 @@ from constants import (BLOCK_REGISTRY,
                        BLOCK_STRING,
                        PIG_STRING,
                        LEVEL_TEMPLATE)
+from cache import Cache, get_cache, get_or_compute
+from bitmap import BitmapShape
+from block_merging import MERGEABLE_BLOCK_NAMES, MergeCandidate, merge_cells
+from coverage import BitmapCoverageEngine, ExactCoverageEngine, get_coverage_engine
+from grid import BandedGrid, Grid
+from metrics import Metrics, get_metrics, get_number_of_vertices
+from stability import STABILITY_CHECKS, UnstableLevelError, check_stability
+from svg_path_to_polygon import SVG_NAMESPACE, get_multipolygon_from_rings, get_subpaths, sample_subpaths
 
 
 class Structure:
@@ -38,61 +47,157 @@ class Structure:
         return number_of_instances
 
 
-    @staticmethod
-    def transpose_and_invert_blocks(blocks):
-        """
-        The blocks start from top-left and go towards bottom-right. This is not
-        practical when constructing a structure. We want to start from
-        bottom-left and go towards top-right. Hence, we transpose and invert
-        blocks.
-        """
-        return [column[::-1] for column in map(list, zip(*blocks))]
-
-
     def __init__(self,
                  level_path,
                  shape,
                  primary_block,
                  platform_block,
-                 num_primary_blocks_on_x_axis):
-        self.blocks = []
+                 num_primary_blocks_on_x_axis,
+                 coverage_engine=None,
+                 cache=None,
+                 write_intermediate_levels=False,
+                 metrics=None,
+                 merge_tolerance=None,
+                 stability_check='no'):
+        '''The blocks are merged only if "merge_tolerance" is given. Refer to
+        "src/python/block_merging.py". "stability_check" is one of
+        "STABILITY_CHECKS". Refer to "src/python/stability.py".'''
+        if stability_check not in STABILITY_CHECKS:
+            raise ValueError(f'The stability check "{stability_check}" is not one of {", ".join(STABILITY_CHECKS)}.')
+        self.grid = None
         self.platforms = []
         self.platform_blocks = []
         self.pig_indices = []
+        self.merged_blocks = []
+        self.merged_cells = None
         self.level_path = level_path
         self.shape = shape
         self.primary_block = primary_block
         self.platform_block = platform_block
+        self.coverage_engine = ExactCoverageEngine() if coverage_engine is None else coverage_engine
+        self.cache = cache
+        self.write_intermediate_levels = write_intermediate_levels
+        self.metrics = Metrics() if metrics is None else metrics
+        self.stability_check = stability_check
         self.num_primary_blocks_to_cover_pig_width = self.get_number_of_instances_required_to_cover_distance(BLOCK_REGISTRY['pig'].width, primary_block.width)
         self.num_primary_blocks_to_cover_pig_height = self.get_number_of_instances_required_to_cover_distance(BLOCK_REGISTRY['pig'].height, primary_block.height)
         self.num_primary_blocks_on_x_axis = num_primary_blocks_on_x_axis
         self.primary_block_factor = self.get_primary_block_factor(num_primary_blocks_on_x_axis)
         self.factored_primary_block_width, self.factored_primary_block_height = self.get_factored_primary_block_dimensions()
         self.num_primary_blocks_on_y_axis = self.get_number_of_instances_required_to_cover_distance(self.get_shape_height(self.shape), self.factored_primary_block_height)
-        # This gets only non-empty rows.
-        self.original_blocks = [row for row in self.get_blocks() if any(row)]
-        self.blocks = self.transpose_and_invert_blocks(self.original_blocks)
-        self.write_level_to_file(self.level_path + '-primary_blocks.xml')
-        # This is to start from bottom row and go towards the top row, instead
-        # of vice-versa.
-        self.original_blocks = self.original_blocks[::-1]
-        self.platforms = sorted(list(self.get_platforms()))
-        self.get_platform_blocks()
-        self.write_level_to_file(self.level_path + '-primary_and_required_platform_blocks.xml')
-        self.generate_extra_platforms()
-        self.get_platform_blocks()
-        self.write_level_to_file(self.level_path + '-primary_and_all_platform_blocks.xml')
-        self.get_blocks_for_pigs()
-        self.vacate_blocks_for_pigs()
+        self.place_primary_blocks()
+        self.place_platforms()
+        self.place_pigs()
+        if merge_tolerance is not None:
+            self.merge_blocks(merge_tolerance)
+
+
+    @classmethod
+    def from_placements(cls,
+                        level_path,
+                        grid,
+                        primary_block,
+                        platform_block,
+                        platforms,
+                        platform_blocks,
+                        pig_indices,
+                        merged_blocks=(),
+                        merged_cells=None):
+        '''Creates the structure of a level that has already been generated,
+        from its grid and the placements of its blocks and pigs, without the
+        shape. The structure can only be written, inspected and checked, not
+        generated again. Refer to "src/python/level_pack.py".'''
+        structure = cls.__new__(cls)
+        structure.grid = grid
+        structure.platforms = platforms
+        structure.platform_blocks = platform_blocks
+        structure.pig_indices = pig_indices
+        structure.merged_blocks = list(merged_blocks)
+        structure.merged_cells = merged_cells
+        structure.level_path = level_path
+        structure.shape = None
+        structure.primary_block = primary_block
+        structure.platform_block = platform_block
+        structure.write_intermediate_levels = False
+        structure.metrics = Metrics()
+        structure.stability_check = 'no'
+        structure.num_primary_blocks_to_cover_pig_width = cls.get_number_of_instances_required_to_cover_distance(BLOCK_REGISTRY['pig'].width, primary_block.width)
+        structure.num_primary_blocks_to_cover_pig_height = cls.get_number_of_instances_required_to_cover_distance(BLOCK_REGISTRY['pig'].height, primary_block.height)
+        return structure
 
 
     def __str__(self):
-        row_strings = []
-        for index, row in enumerate(self.original_blocks):
-            row_string = f'{index:{len(str(len(self.original_blocks) - 1))}}' + ' ' + ('_' if index in self.platforms else ' ')
-            row_string += ''.join(['▉' if block is True else ' ' for block in row])
-            row_strings.append(row_string)
-        return '\n'.join(row_strings[::-1])
+        return self.grid.to_string(self.platforms)
+
+
+    @property
+    def original_blocks(self):
+        '''Rows of the grid, starting from the bottom row.'''
+        return self.grid.rows
+
+
+    @property
+    def blocks(self):
+        '''Columns of the grid, starting from the left column. Every column
+        starts from the bottom row.'''
+        return self.grid.columns
+
+
+    def place_primary_blocks(self):
+        # This gets only non-empty rows, starting from the bottom row and going
+        # towards the top row.
+        with self.metrics.measure('get_blocks'):
+            self.grid = Grid.from_coverage(self.get_blocks())
+        self.write_intermediate_level_to_file('-primary_blocks.xml')
+
+
+    def place_platforms(self):
+        with self.metrics.measure('get_platforms'):
+            self.platforms = sorted(list(self.get_platforms()))
+        with self.metrics.measure('get_platform_blocks'):
+            self.get_platform_blocks()
+        self.write_intermediate_level_to_file('-primary_and_required_platform_blocks.xml')
+        with self.metrics.measure('generate_extra_platforms'):
+            self.generate_extra_platforms()
+        with self.metrics.measure('get_platform_blocks'):
+            self.get_platform_blocks()
+        self.write_intermediate_level_to_file('-primary_and_all_platform_blocks.xml')
+
+
+    def place_pigs(self):
+        with self.metrics.measure('get_blocks_for_pigs'):
+            self.get_blocks_for_pigs()
+        with self.metrics.measure('vacate_blocks_for_pigs'):
+            self.vacate_blocks_for_pigs()
+
+
+    def merge_blocks(self, merge_tolerance):
+        number_of_objects_before_merging = self.get_number_of_objects()
+        with self.metrics.measure('merge_blocks'):
+            self.merged_blocks, self.merged_cells = merge_cells(self.grid.cells,
+                                                                self.platforms,
+                                                                self.get_merge_candidates(merge_tolerance))
+        self.metrics.record(number_of_objects={'before_merging': number_of_objects_before_merging,
+                                               'after_merging': self.get_number_of_objects()})
+
+
+    def get_merge_candidates(self, merge_tolerance):
+        '''Returns the blocks that fit in a rectangle of primary blocks with a
+        shortfall of at most "merge_tolerance" on each axis, in both
+        orientations.'''
+        candidates = []
+        for block_name in MERGEABLE_BLOCK_NAMES:
+            block = BLOCK_REGISTRY[block_name]
+            for rotation, width, height in ((0, block.width, block.height), (90, block.height, block.width)):
+                if rotation and width == height:
+                    continue
+                num_columns = self.get_number_of_instances_required_to_cover_distance(width, self.primary_block.width)
+                num_rows = self.get_number_of_instances_required_to_cover_distance(height, self.primary_block.height)
+                shortfall = max(num_columns * int(self.primary_block.width * MULTIPLIER) - int(width * MULTIPLIER),
+                                num_rows * int(self.primary_block.height * MULTIPLIER) - int(height * MULTIPLIER)) / MULTIPLIER
+                if num_columns * num_rows > 1 and shortfall <= merge_tolerance:
+                    candidates.append(MergeCandidate(block, rotation, num_columns, num_rows, shortfall))
+        return candidates
 
 
     def get_primary_block_factor(self, num_primary_blocks):
@@ -110,57 +215,32 @@ class Structure:
                 self.primary_block.height * self.primary_block_factor)
 
 
-    def is_tile_mostly_in_shape(self, tile):
-        '''We designate an area for the structure and we partition it into small,
-        equal tiles. The tiles can be of any size and shape but for simplicity, they
-        are usually square. The tiles represent the "primary blocks" that are
-        going to form the structure in the output.
-
-        Then, in order to determine whether there should be a block present on a
-        given tile or not, we find the intersection area of the tile with the
-        structure SVG which is given as the input and if the intersection area is
-        greater than half of the tile area, then we return true. Otherwise, we
-        return false.
-        '''
-        return tile.intersection(self.shape).area > tile.area / 2
+    def compute_blocks(self):
+        # Blocks is a boolean array indicating whether or not there is a block
+        # in the indicated index.
+        return self.coverage_engine.get_blocks(self.shape,
+                                               self.factored_primary_block_width,
+                                               self.factored_primary_block_height,
+                                               self.num_primary_blocks_on_y_axis,
+                                               self.num_primary_blocks_on_x_axis)
 
 
     def get_blocks(self):
-        # Blocks is a boolean array indicating whether or not there is a block
-        # in the indicated index.
-        blocks = []
-        for row in range(self.num_primary_blocks_on_y_axis):
-            blocks_in_row = []
-            y = self.shape.bounds[1] + row * self.factored_primary_block_height
-            for column in range(self.num_primary_blocks_on_x_axis):
-                x = self.shape.bounds[0] + column * self.factored_primary_block_width
-                tile = Polygon([(x,y),
-                                (x + self.factored_primary_block_width, y),
-                                (x + self.factored_primary_block_width, y + self.factored_primary_block_height),
-                                (x, y + self.factored_primary_block_height)])
-                if self.is_tile_mostly_in_shape(tile):
-                    blocks_in_row.append(True)
-                else:
-                    blocks_in_row.append(False)
-            blocks.append(blocks_in_row)
-        return blocks
+        key = Cache.get_key('blocks',
+                            self.shape.wkb,
+                            self.factored_primary_block_width,
+                            self.factored_primary_block_height,
+                            self.num_primary_blocks_on_y_axis,
+                            self.num_primary_blocks_on_x_axis,
+                            type(self.coverage_engine).__name__)
+        return get_or_compute(self.cache, 'blocks', key, self.compute_blocks)
 
 
     def get_platforms(self):
         '''In order to support blocks without anything underneath, we need to
         insert platforms.
         '''
-        platforms = set()
-        for column in self.blocks:
-            last_element_is_a_gap = True
-            for row, tile in reversed(list(enumerate(column))):
-                if tile:
-                    last_element_is_a_gap = False
-                else:
-                    if not last_element_is_a_gap:
-                        platforms.add(row + 1)
-                    last_element_is_a_gap = True
-        return platforms
+        return set(self.grid.get_rows_with_unsupported_cells().tolist())
 
 
     def generate_extra_platforms(self):
@@ -168,11 +248,11 @@ class Structure:
             first_platform = self.platforms[0]
             last_platform = self.platforms[-1]
         else:
-            first_platform = last_platform = len(self.original_blocks)
+            first_platform = last_platform = self.grid.num_rows
         self.platforms = set(self.platforms)
         for i in range(first_platform - self.num_primary_blocks_to_cover_pig_height, self.num_primary_blocks_to_cover_pig_height - 1, -self.num_primary_blocks_to_cover_pig_height):
             self.platforms.add(i)
-        for i in range(last_platform + self.num_primary_blocks_to_cover_pig_height, len(self.original_blocks) + 1, self.num_primary_blocks_to_cover_pig_height):
+        for i in range(last_platform + self.num_primary_blocks_to_cover_pig_height, self.grid.num_rows + 1, self.num_primary_blocks_to_cover_pig_height):
             self.platforms.add(i)
         # TODO Insert extra platforms between the first and the last platform
         self.platforms = sorted(list(self.platforms))
@@ -188,10 +268,7 @@ class Structure:
         if start_index < 0:
             start_index = 0
         end_index = self.get_number_of_instances_required_to_cover_distance(lateral_distance + self.platform_block.width / 2, self.primary_block.width)
-        if True in self.original_blocks[index][start_index:end_index]:
-            return True
-        else:
-            return False
+        return self.grid.any_in_row(index, start_index, end_index)
 
 
     def add_if_primary_blocks_exist_above(self, index, lateral_distance, lateral_distances, append=True):
@@ -213,11 +290,11 @@ class Structure:
         # platform that is located right above the top of the structure. Hence,
         # we either need to insert a full platform here, or change the way that
         # the preparation and insertion of the pigs are done.
-        if index == len(self.original_blocks):
+        if index == self.grid.num_rows:
             return lateral_distances
-        number_of_empty_blocks_before_the_first_non_empty_block = self.original_blocks[index].index(True)
-        number_of_empty_blocks_after_the_last_non_empty_block = self.original_blocks[index][::-1].index(True)
-        number_of_non_empty_blocks = len(self.original_blocks[index])
+        number_of_empty_blocks_before_the_first_non_empty_block = self.grid.get_first_occupied_column(index)
+        number_of_empty_blocks_after_the_last_non_empty_block = self.grid.num_columns - 1 - self.grid.get_last_occupied_column(index)
+        number_of_non_empty_blocks = self.grid.num_columns
         number_of_primary_blocks_to_cover = (number_of_non_empty_blocks
                                            - number_of_empty_blocks_before_the_first_non_empty_block
                                            - number_of_empty_blocks_after_the_last_non_empty_block)
@@ -285,8 +362,9 @@ class Structure:
         if not self.platforms:
             return
         rows_to_place_pigs_under = self.get_rows_to_place_pigs_under()
+        platform_indices = {platform: index for index, platform in enumerate(self.platforms)}
         for row in rows_to_place_pigs_under:
-            for platform in self.platform_blocks[self.platforms.index(row)]:
+            for platform in self.platform_blocks[platform_indices[row]]:
                 self.pig_indices.setdefault(row, []).append(self.get_platform_center_index(platform))
 
 
@@ -302,44 +380,62 @@ class Structure:
         offset_for_block_to_fill_on_left = half_of_num_primary_blocks_to_cover_pig_width + (1 if remainder else 0)
         offset_for_block_to_fill_on_right = half_of_num_primary_blocks_to_cover_pig_width + 1
 
+        offsets_for_blocks_to_vacate = numpy.array(offsets_for_blocks_to_vacate, dtype=int)
         for row_index in self.pig_indices:
+            # The rows of the pig are right under the platform.
+            rows_of_pig = slice(row_index - self.num_primary_blocks_to_cover_pig_height, row_index)
             for block_index in self.pig_indices[row_index]:
-                for row_index_offset in range(self.num_primary_blocks_to_cover_pig_height):
-                    row_index_of_block_to_vacate = row_index - 1 - row_index_offset
-                    for column_index_offset in offsets_for_blocks_to_vacate:
-                        column_index_of_block_to_vacate = block_index + column_index_offset
-                        if column_index_of_block_to_vacate > -1 and column_index_of_block_to_vacate < len(self.original_blocks[row_index_of_block_to_vacate]):
-                            self.original_blocks[row_index_of_block_to_vacate][column_index_of_block_to_vacate] = False
-                    # Make sure there is a column of primary blocks to the left
-                    # of the pig.
-                    column_index_of_block_to_fill_on_left = block_index - offset_for_block_to_fill_on_left
-                    if column_index_of_block_to_fill_on_left > -1:
-                        self.original_blocks[row_index_of_block_to_vacate][column_index_of_block_to_fill_on_left] = True
-                    else:
-                        # TODO We might prepend a column in this case but it was
-                        # problemetic when I did that. For example, the
-                        # platforms need to be extended to cover this new column
-                        # as well.
-                        pass
-                    # Make sure there is a column of primary blocks to the right
-                    # of the pig.
-                    column_index_of_block_to_fill_on_right = block_index + offset_for_block_to_fill_on_right
-                    if column_index_of_block_to_fill_on_right < len(self.original_blocks[row_index_of_block_to_vacate]):
-                        self.original_blocks[row_index_of_block_to_vacate][column_index_of_block_to_fill_on_right] = True
-                    else:
-                        # TODO We might append a column in this case but it was
-                        # problemetic when I did that. For example, the
-                        # platforms need to be extended to cover this new column
-                        # as well.
-                        pass
-        self.original_blocks = self.original_blocks[::-1]
-        self.blocks = self.transpose_and_invert_blocks(self.original_blocks)
-        self.original_blocks = self.original_blocks[::-1]
-
-
-    def get_block_height(self, block_type, index):
-        number_of_platforms = bisect_left(sorted(self.platforms), index)
-        if block_type is self.primary_block and index in self.platforms:
+                columns_of_blocks_to_vacate = block_index + offsets_for_blocks_to_vacate
+                columns_of_blocks_to_vacate = columns_of_blocks_to_vacate[(columns_of_blocks_to_vacate > -1)
+                                                                        & (columns_of_blocks_to_vacate < self.grid.num_columns)]
+                self.grid.set_cells(rows_of_pig, columns_of_blocks_to_vacate, False)
+                # Make sure there is a column of primary blocks to the left of
+                # the pig.
+                column_index_of_block_to_fill_on_left = block_index - offset_for_block_to_fill_on_left
+                if column_index_of_block_to_fill_on_left > -1:
+                    self.grid.set_cells(rows_of_pig, column_index_of_block_to_fill_on_left, True)
+                else:
+                    # TODO We might prepend a column in this case but it was
+                    # problemetic when I did that. For example, the platforms
+                    # need to be extended to cover this new column as well.
+                    pass
+                # Make sure there is a column of primary blocks to the right of
+                # the pig.
+                column_index_of_block_to_fill_on_right = block_index + offset_for_block_to_fill_on_right
+                if column_index_of_block_to_fill_on_right < self.grid.num_columns:
+                    self.grid.set_cells(rows_of_pig, column_index_of_block_to_fill_on_right, True)
+                else:
+                    # TODO We might append a column in this case but it was
+                    # problemetic when I did that. For example, the platforms
+                    # need to be extended to cover this new column as well.
+                    pass
+
+
+    def get_grid_dimensions(self):
+        return {'num_rows': self.grid.num_rows,
+                'num_columns': self.grid.num_columns,
+                'tile_width': self.factored_primary_block_width,
+                'tile_height': self.factored_primary_block_height}
+
+
+    def get_block_counts(self):
+        number_of_merged_cells = 0 if self.merged_cells is None else int(self.merged_cells.sum())
+        return {'primary_blocks': int(self.grid.cells.sum()) - number_of_merged_cells,
+                'merged_blocks': len(self.merged_blocks),
+                'platform_blocks': sum(len(platform_blocks_of_row) for platform_blocks_of_row in self.platform_blocks),
+                'pigs': sum(len(pig_indices_of_row) for pig_indices_of_row in self.pig_indices.values())}
+
+
+    def get_number_of_objects(self):
+        return sum(self.get_block_counts().values())
+
+
+    def get_block_height(self, block_type, index, sorted_platforms=None):
+        if sorted_platforms is None:
+            sorted_platforms = sorted(self.platforms)
+        number_of_platforms = bisect_left(sorted_platforms, index)
+        is_platform = number_of_platforms < len(sorted_platforms) and sorted_platforms[number_of_platforms] == index
+        if block_type is self.primary_block and is_platform:
             number_of_platforms += 1
         total_platform_height = number_of_platforms * self.platform_block.height
         total_primary_block_height = index * self.primary_block.height
@@ -350,13 +446,21 @@ class Structure:
               + positioning_distance)
 
 
-    def get_block_string(self, block_type, lateral_distance, vertical_distance, block_material = 'stone'):
+    def get_row_heights(self, block_type):
+        '''The height of a block depends only on its row. Hence, the heights are
+        calculated once for every row, instead of once for every block.'''
+        sorted_platforms = sorted(self.platforms)
+        return [self.get_block_height(block_type, index, sorted_platforms)
+                for index in range(self.grid.num_rows + 1)]
+
+
+    def get_block_string(self, block_type, lateral_distance, vertical_distance, block_material = 'stone', rotation=0):
         if block_type is not BLOCK_REGISTRY['pig']:
             return BLOCK_STRING.format(block_type.xml_element_name,
                                        block_material,
                                        lateral_distance,
                                        vertical_distance,
-                                       0)
+                                       rotation)
         else:
             return PIG_STRING.format(block_type.xml_element_name,
                                      block_material,
@@ -365,66 +469,256 @@ class Structure:
                                      0)
 
 
-    def get_xml_elements_for_pigs(self):
-        pig_elements = ''
+    def generate_xml_elements_for_pigs(self, primary_block_row_heights):
         lateral_distance_correction_index = .5 if self.num_primary_blocks_to_cover_pig_width % 2 == 0 else 0
         for row in self.pig_indices:
             for index in self.pig_indices[row]:
-                pig_elements += self.get_block_string(BLOCK_REGISTRY['pig'],
-                                                      (index + lateral_distance_correction_index) * self.primary_block.width
-                                                      + self.primary_block.width / 2,
-                                                      self.get_block_height(self.primary_block, row - self.num_primary_blocks_to_cover_pig_height)
-                                                      - self.primary_block.height / 2
-                                                      + BLOCK_REGISTRY['pig'].height / 2)
-        return pig_elements
+                yield self.get_block_string(BLOCK_REGISTRY['pig'],
+                                            (index + lateral_distance_correction_index) * self.primary_block.width
+                                            + self.primary_block.width / 2,
+                                            primary_block_row_heights[row - self.num_primary_blocks_to_cover_pig_height]
+                                            - self.primary_block.height / 2
+                                            + BLOCK_REGISTRY['pig'].height / 2)
+
+
+    def generate_xml_elements(self):
+        primary_block_row_heights = self.get_row_heights(self.primary_block)
+        platform_block_row_heights = self.get_row_heights(self.platform_block)
+        for column, row in self.grid.get_occupied_cells(self.merged_cells):
+            yield self.get_block_string(self.primary_block,
+                                        column * self.primary_block.width + self.primary_block.width / 2,
+                                        primary_block_row_heights[row])
+        # The merged blocks are centered horizontally on the cells that they
+        # cover and they stand on the bottom of the cells.
+        for candidate, column, row in self.merged_blocks:
+            yield self.get_block_string(candidate.block,
+                                        (column + candidate.num_columns / 2) * self.primary_block.width,
+                                        primary_block_row_heights[row]
+                                        - self.primary_block.height / 2
+                                        + candidate.height / 2,
+                                        rotation=candidate.rotation)
+        for platform_blocks_of_row, platform_index in zip(self.platform_blocks, self.platforms):
+            for platform_block in platform_blocks_of_row:
+                yield self.get_block_string(self.platform_block,
+                                            platform_block,
+                                            platform_block_row_heights[platform_index])
+        yield from self.generate_xml_elements_for_pigs(primary_block_row_heights)
 
 
     def get_xml_elements(self):
-        primary_block_elements = ''
-        for column in range(len(self.blocks)):
-            for row in range(len(self.blocks[column])):
-                if self.blocks[column][row]:
-                    primary_block_elements += self.get_block_string(self.primary_block,
-                                                                    column * self.primary_block.width + self.primary_block.width / 2,
-                                                                    self.get_block_height(self.primary_block, row))
-        platform_block_elements = ''
-        for platform_blocks_of_row, platform_index in zip(self.platform_blocks, self.platforms):
-            for platform_block in platform_blocks_of_row:
-                platform_block_elements += self.get_block_string(self.platform_block,
-                                                                 platform_block,
-                                                                 self.get_block_height(self.platform_block, platform_index))
-        pig_elements = self.get_xml_elements_for_pigs()
-        return primary_block_elements + platform_block_elements + pig_elements
+        return ''.join(self.generate_xml_elements())
 
 
-    def write_level_to_file(self, file_path):
+    def get_level_xml(self):
+        '''Returns the same XML as "write_xml_elements_to_file" writes.'''
+        level_start, level_end = LEVEL_TEMPLATE.strip().split('{}')
+        return level_start + self.get_xml_elements() + level_end
+
+
+    def write_xml_elements_to_file(self, file_path):
+        '''The elements are written to the file as they are generated, instead
+        of building the whole level in memory first.'''
+        level_start, level_end = LEVEL_TEMPLATE.strip().split('{}')
         with open(file_path, 'w') as level_file:
-            level_file.write(LEVEL_TEMPLATE.strip().format(self.get_xml_elements()))
+            level_file.write(level_start)
+            level_file.writelines(self.generate_xml_elements())
+            level_file.write(level_end)
+
+
+    def flag_or_reject_if_unstable(self):
+        '''Flags or rejects the level if it is unstable, depending on
+        "stability_check".'''
+        if self.stability_check == 'no':
+            return
+        with self.metrics.measure('check_stability'):
+            report = check_stability(self)
+        self.metrics.record(stability=report.to_dict())
+        if report.is_stable:
+            return
+        if self.stability_check == 'reject':
+            raise UnstableLevelError(self.level_path, report)
+        print(f'The level "{self.level_path}" is unstable: {report}', file=stderr)
+
+
+    def write_level_to_file(self, file_path):
+        self.flag_or_reject_if_unstable()
+        with self.metrics.measure('write_level_to_file'):
+            self.write_xml_elements_to_file(file_path)
+
+
+    def write_intermediate_level_to_file(self, suffix):
+        '''Writes a snapshot of the level for debugging, if it is enabled.'''
+        if self.write_intermediate_levels:
+            with self.metrics.measure('write_intermediate_level_to_file'):
+                self.write_xml_elements_to_file(self.level_path + suffix)
+
+
+    def write_metrics_to_file(self, file_path):
+        self.metrics.record(level=self.level_path + '.xml',
+                            num_primary_blocks_on_x_axis=self.num_primary_blocks_on_x_axis,
+                            grid=self.get_grid_dimensions(),
+                            number_of_vertices=get_number_of_vertices(self.shape),
+                            block_counts=self.get_block_counts())
+        self.metrics.write(file_path)
+
+
+class StreamingStructure(Structure):
+    '''Same as Structure, and it produces the same level, but for the
+    structures that are too large to be kept in the memory. The grid is computed
+    in bands of rows and it is kept in a temporary file using a NumPy memmap,
+    instead of being returned by the coverage engine as a whole. The platforms
+    and the pigs are decided by reading only the rows that they need (refer to
+    "BandedGrid" in "src/python/grid.py") and the XML elements of the primary
+    blocks are generated from bands of columns, since they are written column by
+    column.
+
+    The size of the bands is chosen so that the memory that is used while
+    processing a band, which is the peak memory of the generation apart from
+    the memmap pages, is about "memory_target" megabytes. The memmap pages are
+    backed by the temporary file, hence the operating system can drop them.
+
+    The cache is not used, since it would keep the whole grid. The blocks are
+    not merged, since the merging works on the whole grid.
+    '''
+    BYTES_PER_CELL = 64
+    '''Estimate of the memory that is used for a cell of a band. The coverage
+    engines return every row as a list of Python bools and the XML elements
+    are generated from Python ints.'''
+
+    def __init__(self, *arguments, memory_target=64, **keyword_arguments):
+        self.memory_target = memory_target
+        self.cells_file = None
+        super().__init__(*arguments, **keyword_arguments)
+
+
+    def merge_blocks(self, merge_tolerance):
+        raise ValueError('The blocks cannot be merged in the streaming mode.')
+
+
+    def get_number_of_cells_per_band(self):
+        return max(1, int(self.memory_target * 2 ** 20 / self.BYTES_PER_CELL))
+
+
+    def place_primary_blocks(self):
+        num_rows = max(self.num_primary_blocks_on_y_axis, 1)
+        num_columns = self.num_primary_blocks_on_x_axis
+        num_rows_per_band = max(1, self.get_number_of_cells_per_band() // num_columns)
+        self.cells_file = TemporaryFile()
+        cells = numpy.memmap(self.cells_file, dtype=bool, mode='w+', shape=(num_rows, num_columns))
+        # The bands are computed from the top to the bottom, whereas the rows
+        # of the grid start from the bottom. Hence, the non-empty rows are
+        # written from the end of the file backwards.
+        num_non_empty_rows = 0
+        with self.metrics.measure('get_blocks'):
+            for first_row in range(0, self.num_primary_blocks_on_y_axis, num_rows_per_band):
+                band = numpy.array(self.coverage_engine.get_blocks(self.shape,
+                                                                   self.factored_primary_block_width,
+                                                                   self.factored_primary_block_height,
+                                                                   min(num_rows_per_band,
+                                                                       self.num_primary_blocks_on_y_axis - first_row),
+                                                                   num_columns,
+                                                                   first_row=first_row),
+                                   dtype=bool,
+                                   ndmin=2)
+                band = band[band.any(axis=1)]
+                cells[num_rows - num_non_empty_rows - len(band):num_rows - num_non_empty_rows] = band[::-1]
+                num_non_empty_rows += len(band)
+        self.grid = BandedGrid(cells[num_rows - num_non_empty_rows:],
+                               num_rows_per_band,
+                               self.get_number_of_cells_per_band() // max(num_non_empty_rows, 1))
+        self.write_intermediate_level_to_file('-primary_blocks.xml')
 
 
 def get_polygon_from_svg(file):
+    '''Returns all of the <polygon> elements and all of the <path> elements
+    (which are sampled just like "src/python/svg_path_to_polygon.py" does) of
+    the SVG as a MultiPolygon. The rings that are in an odd number of other
+    rings are holes. Refer to "get_multipolygon_from_rings".'''
+    root = etree.parse(file).getroot()
+    rings = [[tuple([float(c) for c in pair.split(',')]) for pair in polygon_element.get('points').split()]
+             for polygon_element in root.iter(f'{SVG_NAMESPACE}polygon')]
+    subpaths = get_subpaths(root)
+    if subpaths:
+        rings.extend(sample_subpaths(subpaths))
+    if not rings:
+        raise ValueError(f'There are no polygons or paths in "{file}".')
     # Need to turn image upside down. The reason is that Potrace generates an
     # upside down SVG image and renders it correctly using "scale" function of
     # the "transform" SVG attribute. Since using the "scale" function is not
     # possible in Shapely, we just generate the shape as upside down and then
     # rotate it.
-    return rotate(Polygon([tuple([float(c) for c in pair.split(',')])
-                    for
-                    pair
-                    in
-                    etree.parse(file).find('.//{http://www.w3.org/2000/svg}polygon').get('points').split()]),
-                  180)
+    return rotate(get_multipolygon_from_rings(rings), 180)
+
+
+def create_structure(level_path, shape, config, cache=None, num_primary_blocks_on_x_axis=None, coverage_engine=None, metrics=None):
+    '''The number of primary blocks on X axis and the coverage engine are read
+    from the config, unless they are given. The bitmap shapes always use the
+    bitmap coverage engine. The structure is a StreamingStructure if
+    "StreamingMemoryTarget" is set.'''
+    if num_primary_blocks_on_x_axis is None:
+        num_primary_blocks_on_x_axis = int(config.get('DEFAULT', 'NumberOfPrimaryBlocksOnXAxis'))
+    if isinstance(shape, BitmapShape):
+        coverage_engine = BitmapCoverageEngine()
+    elif coverage_engine is None:
+        coverage_engine = get_coverage_engine(config.get('DEFAULT', 'CoverageEngine', fallback='exact'))
+    arguments = (level_path,
+                 shape,
+                 BLOCK_REGISTRY[config.get('DEFAULT', 'PrimaryBlock')],
+                 BLOCK_REGISTRY[config.get('DEFAULT', 'PlatformBlock')],
+                 num_primary_blocks_on_x_axis,
+                 coverage_engine,
+                 cache,
+                 config.getboolean('DEFAULT', 'WriteIntermediateLevels', fallback=False),
+                 metrics,
+                 config.getfloat('DEFAULT', 'MergeTolerance', fallback=.05)
+                 if config.getboolean('DEFAULT', 'MergeBlocks', fallback=False) else None,
+                 config.get('DEFAULT', 'StabilityCheck', fallback='no'))
+    memory_target = config.getfloat('DEFAULT', 'StreamingMemoryTarget', fallback=None)
+    if memory_target is not None:
+        return StreamingStructure(*arguments, memory_target=memory_target)
+    return Structure(*arguments)
+
+
+def get_level_name(svg_file_name):
+    return svg_file_name.split('/')[-1].split('.')[0]
+
+
+def get_default_level_path(config, level_name):
+    return config.get('DEFAULT', 'LevelPath') + level_name
+
+
+def generate_structure_from_svg(svg_file_name, config, get_level_path=None):
+    '''Writes the level and returns the structure. "get_level_path" returns
+    the level path (the level file name without ".xml") of the level name. It
+    is "LevelPath" followed by the level name by default.'''
+    cache = get_cache(config)
+    metrics = get_metrics(config)
+    if get_level_path is None:
+        get_level_path = lambda level_name: get_default_level_path(config, level_name)
+    try:
+        with metrics.profile():
+            with metrics.measure('get_polygon_from_svg'):
+                shape = get_polygon_from_svg(svg_file_name)
+            structure = create_structure(get_level_path(get_level_name(svg_file_name)),
+                                         shape,
+                                         config,
+                                         cache,
+                                         metrics=metrics)
+            structure.write_level_to_file(structure.level_path + '.xml')
+        if config.getboolean('DEFAULT', 'WriteMetrics', fallback=False):
+            structure.write_metrics_to_file(structure.level_path + '.json')
+    finally:
+        if cache is not None:
+            cache.save_statistics()
+    return structure
+
+
+def generate_level_from_svg(svg_file_name, config):
+    '''Returns the name of the level file.'''
+    return generate_structure_from_svg(svg_file_name, config).level_path + '.xml'
 
 
 if __name__ == '__main__':
-    svg_file_name = argv[1]
     config = ConfigParser()
     config.read('config.ini')
-
-    structure = Structure(config.get('DEFAULT', 'LevelPath') + svg_file_name.split('/')[-1].split('.')[0],
-                          get_polygon_from_svg(svg_file_name),
-                          BLOCK_REGISTRY[config.get('DEFAULT', 'PrimaryBlock')],
-                          BLOCK_REGISTRY[config.get('DEFAULT', 'PlatformBlock')],
-                          int(config.get('DEFAULT', 'NumberOfPrimaryBlocksOnXAxis')))
-
-    structure.write_level_to_file(structure.level_path + '.xml')
+    generate_level_from_svg(argv[1], config)
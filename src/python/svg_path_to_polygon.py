@@ -1,21 +1,236 @@
-from sys import argv
+'''Converts the <path> elements of a Potrace SVG to <polygon> elements.
 
+Usage:
+
+    python3 src/python/svg_path_to_polygon.py svg_file [--tolerance T] [--number-of-samples N]
+
+Every closed subpath of every <path> element becomes a <polygon> element. The
+first <polygon> element is always the outline of the largest part of the image.
+
+By default, the subpaths are sampled at "NUM_SAMPLES" points in total, which are
+distributed uniformly along the lengths of the subpaths. If a tolerance is
+given, the number of points on every segment is chosen so that the polygon
+deviates from the segment by at most the tolerance instead. This places more
+points on the segments with high curvature and fewer points on the straight
+ones.
+
+The number of vertices and the time spent on sampling are reported on the
+standard error, so that the tradeoff between the two can be tuned.
+'''
+from argparse import ArgumentParser
+from functools import reduce
+from math import acos, ceil, radians, sqrt
+from sys import stderr
+from time import perf_counter
+
+import numpy
 from lxml import etree
-from svgpathtools import parse_path
+from shapely.geometry import MultiPolygon, Point, Polygon
+from shapely.validation import explain_validity, make_valid
+from svgpathtools import CubicBezier, Line, QuadraticBezier, parse_path
 
 SVG_NAMESPACE = '{http://www.w3.org/2000/svg}'
-file_name, extension = argv[1].rsplit('.')
-root = etree.parse(file_name + '.' + extension).getroot()
-group_element = root.find(f'{SVG_NAMESPACE}g')
-path_element = group_element.find(f'{SVG_NAMESPACE}path')
-path = parse_path(path_element.get('d'))
-
 NUM_SAMPLES = 1024
+MIN_NUM_SAMPLES_OF_SUBPATH = 4
+
+
+def get_points_on_segments(segments, segment_indices, ts):
+    '''Evaluates the segments at the given parameters. The point "i" is the
+    point at the parameter "ts[i]" of the segment "segment_indices[i]". The
+    Lines and the Bezier curves are evaluated at once using NumPy, with the same
+    formulas that svgpathtools uses.'''
+    points = numpy.empty(len(ts), dtype=complex)
+    segment_types = numpy.array([type(segment) for segment in segments], dtype=object)[segment_indices]
+    for segment_type, control_point_names in ((Line, ('start', 'end')),
+                                              (QuadraticBezier, ('start', 'control', 'end')),
+                                              (CubicBezier, ('start', 'control1', 'control2', 'end'))):
+        is_of_type = segment_types == segment_type
+        if not is_of_type.any():
+            continue
+        control_points = numpy.array([[getattr(segment, name, 0) for name in control_point_names]
+                                      for segment in segments],
+                                     dtype=complex)[segment_indices[is_of_type]].T
+        t = ts[is_of_type]
+        if segment_type is Line:
+            start, end = control_points
+            points[is_of_type] = start + (end - start) * t
+        elif segment_type is QuadraticBezier:
+            start, control, end = control_points
+            tc = 1 - t
+            points[is_of_type] = tc * tc * start + 2 * tc * t * control + t * t * end
+        else:
+            start, control1, control2, end = control_points
+            points[is_of_type] = start + t * (
+                3 * (control1 - start) + t * (
+                    3 * (start + control2) - 6 * control1 + t * (
+                        -start + 3 * (control1 - control2) + end)))
+    # Arcs are not produced by Potrace, hence they are evaluated one by one.
+    for index in numpy.flatnonzero([segment_type not in (Line, QuadraticBezier, CubicBezier)
+                                    for segment_type in segment_types]):
+        points[index] = segments[segment_indices[index]].point(ts[index])
+    return points
+
+
+def sample_path_uniformly(path, num_samples):
+    '''Same as [path.point(i / (num_samples - 1)) for i in range(num_samples)],
+    but the segments are evaluated at once.'''
+    segments = list(path)
+    lengths = [segment.length() for segment in segments]
+    total_length = sum(lengths)
+    segment_ends = numpy.cumsum([length / total_length for length in lengths])
+    segment_starts = numpy.concatenate(([0.], segment_ends[:-1]))
+    positions = numpy.arange(num_samples) / (num_samples - 1)
+    segment_indices = numpy.minimum(numpy.searchsorted(segment_ends, positions), len(path) - 1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ts = ((positions - segment_starts[segment_indices])
+            / (segment_ends[segment_indices] - segment_starts[segment_indices]))
+    # Path.point has shortcuts for the first and the last positions.
+    segment_indices[0], ts[0] = 0, 0.
+    segment_indices[-1], ts[-1] = len(path) - 1, 1.
+    return get_points_on_segments(segments, segment_indices, ts)
+
+
+def get_number_of_samples_of_segment(segment, tolerance):
+    '''The distance between a curve and its chord on a parameter interval of
+    length "h" is at most "M * h * h / 8", where "M" is the maximum of the
+    second derivative of the curve. Hence, "sqrt(M / (8 * tolerance))" samples
+    keep the polygon within the tolerance.'''
+    if isinstance(segment, Line):
+        return 1
+    if isinstance(segment, CubicBezier):
+        p0, p1, p2, p3 = segment.bpoints()
+        maximum_second_derivative = 6 * max(abs(p0 - 2 * p1 + p2), abs(p1 - 2 * p2 + p3))
+    elif isinstance(segment, QuadraticBezier):
+        p0, p1, p2 = segment.bpoints()
+        maximum_second_derivative = 2 * abs(p0 - 2 * p1 + p2)
+    else:
+        radius = max(segment.radius.real, segment.radius.imag)
+        if tolerance >= radius:
+            return 2
+        return max(1, ceil(radians(abs(segment.delta)) / (2 * acos(1 - tolerance / radius))))
+    return max(1, ceil(sqrt(maximum_second_derivative / (8 * tolerance))))
+
+
+def sample_path_adaptively(path, tolerance):
+    '''The end of every segment is the start of the next one. Hence, every
+    segment is sampled excluding its end, except for the last one.'''
+    numbers_of_samples = numpy.array([get_number_of_samples_of_segment(segment, tolerance) for segment in path])
+    segment_indices = numpy.repeat(numpy.arange(len(path)), numbers_of_samples)
+    first_samples_of_segments = numpy.repeat(numpy.cumsum(numbers_of_samples) - numbers_of_samples, numbers_of_samples)
+    ts = (numpy.arange(len(segment_indices)) - first_samples_of_segments) / numbers_of_samples[segment_indices]
+    segment_indices = numpy.append(segment_indices, len(path) - 1)
+    ts = numpy.append(ts, 1.)
+    return get_points_on_segments(list(path), segment_indices, ts)
+
+
+def get_subpaths(root):
+    subpaths = []
+    for path_element in root.iter(f'{SVG_NAMESPACE}path'):
+        subpaths.extend(subpath for subpath in parse_path(path_element.get('d')).continuous_subpaths() if len(subpath))
+    return subpaths
+
+
+def get_ring_area(ring):
+    return abs(Polygon(ring).area) if len(ring) > 2 else 0
+
+
+def sample_subpaths(subpaths, tolerance=None, num_samples=NUM_SAMPLES):
+    '''Returns a list of rings, where every ring is a list of (x, y) tuples.
+    The rings are sorted by their areas in descending order.'''
+    if tolerance is None:
+        lengths = [subpath.length() for subpath in subpaths]
+        total_length = sum(lengths)
+        if len(subpaths) == 1:
+            numbers_of_samples = [num_samples]
+        else:
+            numbers_of_samples = [max(MIN_NUM_SAMPLES_OF_SUBPATH, round(num_samples * length / total_length))
+                                  for length in lengths]
+        sampled_subpaths = [sample_path_uniformly(subpath, number_of_samples)
+                            for subpath, number_of_samples in zip(subpaths, numbers_of_samples)]
+    else:
+        sampled_subpaths = [sample_path_adaptively(subpath, tolerance) for subpath in subpaths]
+    rings = [[(round(x, 2), round(y, 2)) for x, y in zip(points.real.tolist(), points.imag.tolist())]
+             for points in sampled_subpaths]
+    return sorted(rings, key=get_ring_area, reverse=True)
+
+
+def get_polygons(geometry):
+    '''Returns the polygons of a geometry of any type, without its points and
+    lines.'''
+    if isinstance(geometry, Polygon):
+        return [] if geometry.is_empty else [geometry]
+    return [polygon for part in getattr(geometry, 'geoms', []) for polygon in get_polygons(part)]
+
+
+def get_multipolygon_from_crossing_rings(ring_polygons):
+    '''Applies the even-odd rule to the areas of the rings, that is, a point
+    is in the shape if it is in an odd number of rings. The rings can overlap
+    and cross each other.'''
+    areas = [MultiPolygon(get_polygons(make_valid(ring_polygon))) for ring_polygon in ring_polygons]
+    return MultiPolygon(get_polygons(reduce(lambda shape, area: shape.symmetric_difference(area), areas)))
+
+
+def get_multipolygon_from_rings(rings):
+    '''Resolves the holes using the even-odd rule. That is, a ring that is in
+    an odd number of other rings is a hole of the smallest ring that contains
+    it.
+
+    Testing a single point of every ring is correct only for the rings that are
+    nested and do not cross each other, which is the case for the outlines that
+    Potrace traces. If the result is not valid (for example, if two <polygon>
+    elements overlap), the even-odd rule is applied to the areas of the rings
+    instead. Raises ValueError if even that is not valid.'''
+    rings = sorted((ring for ring in rings if get_ring_area(ring) > 0), key=get_ring_area, reverse=True)
+    ring_polygons = [Polygon(ring) for ring in rings]
+    depths = []
+    holes = {}
+    for index, ring in enumerate(rings):
+        parent = None
+        # The rings are sorted by their areas, hence the last containing ring is
+        # the smallest one.
+        for candidate in range(index - 1, -1, -1):
+            if ring_polygons[candidate].contains(Point(ring[0])):
+                parent = candidate
+                break
+        depths.append(0 if parent is None else depths[parent] + 1)
+        if depths[-1] % 2 == 1:
+            holes.setdefault(parent, []).append(ring)
+    multipolygon = MultiPolygon([Polygon(ring, holes.get(index, []))
+                                 for index, ring in enumerate(rings)
+                                 if depths[index] % 2 == 0])
+    if multipolygon.is_valid:
+        return multipolygon
+    multipolygon = get_multipolygon_from_crossing_rings(ring_polygons)
+    if not multipolygon.is_valid:
+        raise ValueError(f'The rings do not form a valid shape: {explain_validity(multipolygon)}.')
+    return multipolygon
+
+
+def convert_svg_path_to_polygon(svg_file_name, tolerance=None, num_samples=NUM_SAMPLES):
+    '''Writes the polygon SVG next to the given SVG and returns its name and the
+    rings of the polygon.'''
+    file_name, extension = svg_file_name.rsplit('.', 1)
+    root = etree.parse(file_name + '.' + extension).getroot()
+    rings = sample_subpaths(get_subpaths(root), tolerance, num_samples)
+
+    group_element = root.find(f'{SVG_NAMESPACE}g')
+    for path_element in list(root.iter(f'{SVG_NAMESPACE}path')):
+        path_element.getparent().remove(path_element)
+    for index, ring in enumerate(rings):
+        group_element.insert(index, etree.Element('polygon', points=' '.join(str(x) + ',' + str(y) for x, y in ring)))
+    polygon_svg_file_name = file_name + '-polygon.' + extension
+    etree.ElementTree(root).write(polygon_svg_file_name, pretty_print=True)
+    return polygon_svg_file_name, rings
 
-polygon = []
-for i in range(NUM_SAMPLES):
-    polygon.append(path.point(i / (NUM_SAMPLES - 1)))
 
-group_element.remove(path_element)
-group_element.insert(0, etree.Element('polygon', points=' '.join(str(p[0]) + ',' + str(p[1]) for p in [(round(e.real, 2), round(e.imag, 2)) for e in polygon])))
-etree.ElementTree(root).write(file_name + '-polygon.' + extension, pretty_print=True)
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('svg_file_name')
+    argument_parser.add_argument('--tolerance', type=float)
+    argument_parser.add_argument('--number-of-samples', type=int, default=NUM_SAMPLES)
+    arguments = argument_parser.parse_args()
+    start = perf_counter()
+    _, rings = convert_svg_path_to_polygon(arguments.svg_file_name, arguments.tolerance, arguments.number_of_samples)
+    print(f'{sum(len(ring) for ring in rings)} vertices in {len(rings)} polygons, '
+          f'sampled in {(perf_counter() - start) * 1000:.1f} ms',
+          file=stderr)
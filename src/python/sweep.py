@@ -0,0 +1,132 @@
+'''Generates the levels of a polygon at many resolutions (that is, numbers of
+primary blocks on X axis) in one run. The polygon is read and prepared only
+once and the resolutions are processed from the coarsest to the finest, so that
+the tiles that a coarser resolution proved to be completely in or completely out
+of the shape are not tested again. Refer to "ProgressiveCoverageEngine" in
+"src/python/coverage.py".
+
+Usage:
+
+    python3 src/python/sweep.py polygon_svg_file resolution ... [--number-of-workers N]
+
+A resolution is either a number or an inclusive range in the form
+"start:stop" or "start:stop:step". For example, "10:50:10 80" is the same as
+"10 20 30 40 50 80". The level of every resolution is written to
+"LevelPath/<level name>-<resolution>.xml".
+
+If more than one worker is used, the resolutions are distributed to the workers
+in turns, so that every worker still goes from a coarse resolution to a finer
+one.
+'''
+from argparse import ArgumentParser, ArgumentTypeError
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser
+
+from cache import get_cache
+from coverage import ProgressiveCoverageEngine
+from metrics import get_metrics
+from structure import create_structure, get_level_name, get_polygon_from_svg
+
+CONFIG_FILE_NAME = 'config.ini'
+
+config = None
+shape = None
+
+
+def get_resolutions(resolution_string):
+    '''Returns the list of the resolutions in "start", "start:stop" or
+    "start:stop:step" form.'''
+    try:
+        parts = [int(part) for part in resolution_string.split(':')]
+    except ValueError:
+        raise ArgumentTypeError(f'invalid resolution: {resolution_string}')
+    if len(parts) == 1:
+        resolutions = parts
+    elif len(parts) > 3 or (len(parts) == 3 and parts[2] < 1):
+        raise ArgumentTypeError(f'invalid resolution range: {resolution_string}')
+    else:
+        start, stop, step = parts if len(parts) == 3 else parts + [1]
+        resolutions = list(range(start, stop + 1, step))
+    if not resolutions:
+        raise ArgumentTypeError(f'empty resolution range: {resolution_string}')
+    if min(resolutions) < 1:
+        raise ArgumentTypeError(f'resolutions must be at least 1: {resolution_string}')
+    return resolutions
+
+
+def get_number_of_workers(number_of_workers_string):
+    try:
+        number_of_workers = int(number_of_workers_string)
+    except ValueError:
+        raise ArgumentTypeError(f'invalid number of workers: {number_of_workers_string}')
+    if number_of_workers < 1:
+        raise ArgumentTypeError(f'the number of workers must be at least 1: {number_of_workers_string}')
+    return number_of_workers
+
+
+def generate_levels_for_resolutions(level_path, shape, config, resolutions, cache=None):
+    '''Returns a dictionary of the resolutions to the names of their level
+    files.'''
+    coverage_engine = ProgressiveCoverageEngine()
+    level_file_names = {}
+    for resolution in sorted(set(resolutions)):
+        metrics = get_metrics(config)
+        with metrics.profile():
+            structure = create_structure(f'{level_path}-{resolution}', shape, config, cache, resolution, coverage_engine, metrics)
+            level_file_names[resolution] = structure.level_path + '.xml'
+            structure.write_level_to_file(level_file_names[resolution])
+        if config.getboolean('DEFAULT', 'WriteMetrics', fallback=False):
+            structure.write_metrics_to_file(structure.level_path + '.json')
+    return level_file_names
+
+
+def initialize_worker(default_section, shape_of_worker):
+    global config, shape
+    config = ConfigParser()
+    config.read_dict({'DEFAULT': default_section})
+    shape = shape_of_worker
+
+
+def generate_levels_in_worker(level_path, resolutions):
+    cache = get_cache(config)
+    try:
+        return generate_levels_for_resolutions(level_path, shape, config, resolutions, cache)
+    finally:
+        if cache is not None:
+            cache.save_statistics()
+
+
+def sweep(level_path, shape, config, resolutions, number_of_workers=1):
+    '''Same as generate_levels_for_resolutions but the resolutions are
+    distributed to "number_of_workers" worker processes.'''
+    resolutions = sorted(set(resolutions))
+    if number_of_workers == 1:
+        initialize_worker(dict(config['DEFAULT']), shape)
+        return generate_levels_in_worker(level_path, resolutions)
+    level_file_names = {}
+    with ProcessPoolExecutor(number_of_workers,
+                             initializer=initialize_worker,
+                             initargs=(dict(config['DEFAULT']), shape)) as executor:
+        for level_file_names_of_worker in executor.map(generate_levels_in_worker,
+                                                       [level_path] * number_of_workers,
+                                                       [resolutions[worker::number_of_workers]
+                                                        for worker in range(number_of_workers)]):
+            level_file_names.update(level_file_names_of_worker)
+    return dict(sorted(level_file_names.items()))
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('svg_file_name')
+    argument_parser.add_argument('resolutions', type=get_resolutions, nargs='+')
+    argument_parser.add_argument('--number-of-workers', type=get_number_of_workers, default=1)
+    arguments = argument_parser.parse_args()
+    main_config = ConfigParser()
+    main_config.read(CONFIG_FILE_NAME)
+    level_file_names = sweep(main_config.get('DEFAULT', 'LevelPath') + get_level_name(arguments.svg_file_name),
+                             get_polygon_from_svg(arguments.svg_file_name),
+                             main_config,
+                             [resolution for resolutions in arguments.resolutions for resolution in resolutions],
+                             arguments.number_of_workers)
+    for resolution, level_file_name in level_file_names.items():
+        print(f'{resolution:5} {level_file_name}')
@@ -4,8 +4,4 @@
 
 find Images/Edited -name '.DS_Store' -delete
 find Images/Edited -name '*-*' -delete
-find Images/Edited -type f | while read image
-do
-    echo "$image"
-    src/shell/generate-level.sh "$image"
-done
+python3 src/python/generate_levels_for_images.py Images/Edited "$@"
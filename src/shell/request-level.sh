@@ -0,0 +1,6 @@
+#!/bin/bash
+
+# Same as "src/shell/generate-level.sh" but the level is generated by a running
+# "src/python/server.py --socket". Prints the name of the level file.
+
+python3 src/python/client.py "$@"